@@ -1,16 +1,224 @@
 import csv
+import hmac
+import json
 import random
 import os
+import sys
+import threading
+import time
+from collections import namedtuple
 
-from flask import Flask, render_template, request
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    render_template,
+    request,
+    send_from_directory,
+)
 from flask_bootstrap import Bootstrap
 
-from recommenders import RecSystem
-from data import User
+import metrics
+from cache import CardCache, RecommendationCache
+from recommenders import RecSystem, current_rec_system, rec_system_for
+from serving import RecommendationService
+from data import DataContext, Museum, User, get_context, locked_context, set_context
+from images import DERIVATIVE_DIR, DerivativeIndex, build_derivatives
+from ingest import ingest_visits, parse_csv, parse_jsonl
+from snapshot import build_snapshot, data_version
 
 
+# Record the time spent in the stages of a request, see /metrics and ?profile=1
+metrics.instrument(User, ["__init__", "get_museum_description_nouns"])
+metrics.instrument(
+    RecSystem,
+    [
+        "recommend_all",
+        "build_context",
+        "get_relevant_ids",
+        "closest_cities",
+        "find_museums",
+        "local_spots",
+        "hidden_gems",
+        "perfect_matches",
+        "also_visited",
+    ],
+)
+metrics.instrument(Museum, ["image_url", "events", "event_topics", "description_nouns"])
+render_template = metrics.timed("render_template")(render_template)
+
 app = Flask(__name__)
-rs = RecSystem()
+rec_cache = RecommendationCache()
+# Uses the RecSystem of the current version of the data, see reload_data()
+service = RecommendationService(cache=rec_cache)
+derivatives = DerivativeIndex.load()
+app.jinja_env.globals.update(image_src=derivatives.src, image_srcset=derivatives.srcset)
+
+CardParts = namedtuple("CardParts", ["top", "events", "city", "has_events"])
+
+
+def render_card_parts(museum, events) -> CardParts:
+    # The user-independent parts of museum_card.html, see templates/museum_card_parts.html
+    parts = app.jinja_env.get_template("museum_card_parts.html").module
+    return CardParts(
+        top=parts.card_top(museum),
+        events=parts.card_events(events),
+        city=parts.card_city(museum),
+        has_events=len(events) > 0,
+    )
+
+
+card_cache = CardCache(render_card_parts)
+app.jinja_env.globals.update(card_parts=card_cache.get)
+
+# The derivative file names are content-hashed, so a file never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Required to post new visits to /visits and to reload the data with /admin/reload;
+# without it these endpoints are disabled
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN")
+# Seconds between checks whether the data files changed, 0 only reloads on /admin/reload
+DATA_RELOAD_INTERVAL = float(os.environ.get("DATA_RELOAD_INTERVAL", 0))
+
+_reload_lock = threading.Lock()
+
+
+def reload_data() -> bool:
+    """
+    Load the data again in a background thread and swap it in once it is ready. Requests
+    are served from the current version meanwhile.
+
+    Returns:
+    bool: False if a reload is already running.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            with metrics.stage("reload"):
+                context = DataContext().load()
+                # Build the indexes before the swap, so no request waits for them
+                rec_system_for(context)
+                set_context(context)
+                rec_cache.invalidate()
+        except Exception as e:
+            # The current version stays in use
+            print(json.dumps({"event": "reload_failed", "error": repr(e)}), file=sys.stderr)
+        finally:
+            _reload_lock.release()
+
+    threading.Thread(target=run, name="data-reload", daemon=True).start()
+    return True
+
+
+def watch_data(interval: float):
+    # Reload the data when the source files change
+    while True:
+        time.sleep(interval)
+        if data_version() != get_context().version:
+            reload_data()
+
+
+if DATA_RELOAD_INTERVAL > 0:
+    threading.Thread(
+        target=watch_data, args=(DATA_RELOAD_INTERVAL,), name="data-watch", daemon=True
+    ).start()
+
+
+def is_authorized() -> bool:
+    authorization = request.headers.get("Authorization", "")
+    return bool(INGEST_TOKEN) and hmac.compare_digest(
+        authorization, f"Bearer {INGEST_TOKEN}"
+    )
+
+
+def get_recommendations(key: str):
+    # Returns the user with their recommendations, and whether all sections were computed
+    # before the deadline
+    return service.recommend(key)
+
+
+def render_recommendations(usr, recs, complete: bool = True):
+    return render_template(
+        "recommendations.html",
+        perfect_matches=recs.perfect_matches,
+        hidden_gems=recs.hidden_gems,
+        local_spots=recs.local_spots,
+        also_visited=recs.also_visited,
+        visited=usr.previous_visits,
+        user=usr,
+        partial=not complete,
+    )
+
+
+def get_user(key: str, context: DataContext = None) -> User:
+    # The member with this PersonID, or a 404 when there is none
+    try:
+        return User(key, context)
+    except KeyError:
+        abort(404)
+
+
+def recommendations_page(key: str):
+    if request.args.get("profile") == "1":
+        # Compute the page without the cache, and return where the time was spent
+        with metrics.profile() as profile, metrics.stage("request"):
+            usr = get_user(key)
+            render_recommendations(usr, rec_system_for(usr.context).recommend_all(usr))
+        return Response(profile.collapsed(), mimetype="text/plain")
+
+    if "quantile" in request.args:
+        # Local spots below another popularity quantile, e.g. ?quantile=0.8. The cache only
+        # holds the recommendations with the default quantile, so these are computed.
+        quantile = request.args.get("quantile", type=float)
+        if quantile is None or not 0 < quantile < 1:
+            abort(400)
+        rec_system = current_rec_system().with_params(quantile=quantile)
+        usr = get_user(key, rec_system.context)
+        return render_recommendations(usr, rec_system.recommend_all(usr))
+
+    try:
+        recommendations = get_recommendations(key)
+    except KeyError:
+        # Raised by the User of an unknown PersonID
+        abort(404)
+    return render_recommendations(*recommendations)
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    if "request_start" in g and request.endpoint:
+        metrics.observe(f"route:{request.endpoint}", time.perf_counter() - g.request_start)
+    return response
+
+
+@app.cli.command("build-snapshot")
+def build_snapshot_command():
+    """Write the cleaned tables and indexes to the binary snapshot in data/snapshot."""
+    build_snapshot()
+
+
+@app.cli.command("build-images")
+def build_images_command():
+    """Resize the museum images to the derivatives in static/derivatives."""
+    build_derivatives()
+
+
+@app.route("/images/<path:filename>")
+def derivative_image(filename: str):
+    # send_from_directory adds an ETag and answers conditional requests with 304
+    response = send_from_directory(
+        DERIVATIVE_DIR, filename, max_age=IMMUTABLE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 @app.route("/")
@@ -20,7 +228,7 @@ def index():
 
 @app.route("/id/<key>")
 def get_user_info(key: str):
-    usr = User(key)
+    usr = get_user(key)
     return render_template("user.html", user=usr)
 
 
@@ -31,6 +239,7 @@ def recommendations():
         perfect_matches=[],
         hidden_gems=[],
         local_spots=[],
+        also_visited=[],
         visited=None,
         user=None,
     )
@@ -38,41 +247,68 @@ def recommendations():
 
 @app.route("/recommendations/<key>")
 def recommendations_id(key: str):
-    usr = User(key)
-    perfect_matches = rs.perfect_matches(usr)
-    hidden_gems = rs.hidden_gems(usr)
-    local_spots = rs.local_spots(usr)
-    return render_template(
-        "recommendations.html",
-        perfect_matches=perfect_matches,
-        hidden_gems=hidden_gems,
-        local_spots=local_spots,
-        visited=usr.previous_visits,
-        user=usr,
-    )
+    return recommendations_page(key)
 
 
 @app.route("/recommendations/login", methods=["GET"])
 def recommendations_id_login():
     key = request.args.get("key")
-    usr = User(key)
-    perfect_matches = rs.perfect_matches(usr)
-    hidden_gems = rs.hidden_gems(usr)
-    local_spots = rs.local_spots(usr)
-    return render_template(
-        "recommendations.html",
-        perfect_matches=perfect_matches,
-        hidden_gems=hidden_gems,
-        local_spots=local_spots,
-        visited=usr.previous_visits,
-        user=usr,
-    )
+    if not key:
+        abort(400)
+    return recommendations_page(key)
 
 
 @app.route("/recommendations/random")
 def recommendations_random():
-    user_id = random.choice(rs.all_users.PersonID)
-    return recommendations_id(user_id)
+    # The sorted PersonIDs of the user store, so the members table is not read
+    user_id = random.choice(get_context().user_store.member_ids)
+    return recommendations_id(str(user_id))
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    return dict(rec_cache.stats(), serving=service.stats(), cards=card_cache.stats())
+
+
+@app.route("/visits", methods=["POST"])
+def post_visits():
+    # Adds a delta of visits.csv, as CSV (Content-Type: text/csv) or JSON lines
+    if not is_authorized():
+        abort(403)
+
+    text = request.get_data(as_text=True)
+    try:
+        records = parse_csv(text) if request.mimetype == "text/csv" else parse_jsonl(text)
+        # The data is not swapped while the visits are added, so a reload keeps them
+        with locked_context() as context:
+            return ingest_visits(records, context.user_store, rec_cache)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    # Starts loading the data again; /health shows the version once it is swapped in
+    if not is_authorized():
+        abort(403)
+    started = reload_data()
+    return {"reloading": True, "started": started}, 202
+
+
+@app.route("/health")
+def health():
+    context = get_context()
+    return {
+        "status": "ok",
+        "data_version": context.version,
+        "loaded_at": context.loaded_at.isoformat(),
+        "reloading": _reload_lock.locked(),
+    }
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/about")
@@ -0,0 +1,26 @@
+"""
+The benchmarks run on a synthetic dataset, generated once per scale in .benchmarks/data:
+
+    BENCHMARK_SCALE=medium pytest benchmarks --benchmark-autosave
+
+The data modules read their folder from DATA_DIR when they are imported, so it is set here,
+before the benchmark modules import them.
+"""
+
+import os
+
+from benchmarks.synthetic import SCALES, generate, is_generated
+
+SCALE = os.environ.get("BENCHMARK_SCALE", "small")
+N_MEMBERS, N_MUSEUMS = SCALES[SCALE]
+BENCHMARK_DATA_DIR = os.path.join(".benchmarks", "data", SCALE)
+
+if not is_generated(BENCHMARK_DATA_DIR, N_MEMBERS, N_MUSEUMS):
+    generate(BENCHMARK_DATA_DIR, N_MEMBERS, N_MUSEUMS)
+os.environ["DATA_DIR"] = BENCHMARK_DATA_DIR
+
+from snapshot import build_snapshot, is_fresh
+
+# Start from the binary snapshot, like the app does after `flask build-snapshot`
+if not is_fresh():
+    build_snapshot()
@@ -0,0 +1,75 @@
+"""
+Startup time of the app, measured with `python -X importtime`:
+
+    python -m benchmarks.importtime --module app --budget 1.5
+
+Prints the imports that take longest (including the modules they import in turn) and exits
+with status 1 when importing the module takes longer than the budget. The data is loaded on
+first use, so importing the app should not read any table or load spaCy.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Seconds that `import app` may take, in a fresh interpreter
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", 1.5))
+# Modules that are only needed when the data is loaded or the nouns are extracted
+LAZY_MODULES = ["spacy", "scipy.spatial", "PIL"]
+
+
+def measure(module: str = "app") -> tuple[list[tuple], set]:
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+    tuple: The (name, seconds, seconds including its imports, depth) of every imported
+    module, in the order they finished, and the names of all modules loaded afterwards.
+    """
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6, depth))
+    return imports, set(result.stdout.split())
+
+
+def report(imports: list[tuple], top: int = 15) -> str:
+    # The slowest imports by their time including the modules they import
+    lines = [f"{'cumulative':>10} {'self':>8}  module"]
+    for name, own, cumulative, depth in sorted(imports, key=lambda row: -row[2])[:top]:
+        lines.append(f"{cumulative:>9.3f}s {own:>7.3f}s  {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+def total(imports: list[tuple], module: str) -> float:
+    return next(cumulative for name, _, cumulative, _ in imports if name == module)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of a module.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    imports, modules = measure(args.module)
+    print(report(imports, args.top))
+    seconds = total(imports, args.module)
+    print(f"\nimport {args.module}: {seconds:.3f}s (budget {args.budget:.3f}s)")
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"Imported at startup, but only needed later: {', '.join(eager)}")
+    if seconds > args.budget or eager:
+        sys.exit(1)
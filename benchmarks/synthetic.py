@@ -0,0 +1,211 @@
+"""
+Deterministic synthetic dataset for the benchmarks.
+
+Writes members, visits, museums, events, topics, cities and museum nouns as CSV files with
+the columns the app reads, plus the noun index, so no spaCy model is needed:
+
+    python -m benchmarks.synthetic --scale medium --output .benchmarks/data/medium
+
+The same seed and scale always give the same files.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from nouns import description_hash, write_noun_index
+
+# Scale -> (number of members, number of museums)
+SCALES = {
+    "small": (1_000, 500),
+    "medium": (100_000, 2_000),
+    "large": (1_500_000, 5_000),
+}
+
+# The museums.csv header; the app reads the columns by position (see data.MUSEUM_FIELDS)
+MUSEUM_COLUMNS = [
+    "_id", "type", "teaser", "metaDescription", "description", "kidsDescription",
+    "museumColor", "showpieceIds", "impressionCarrousel", "museumHighlightsCarrousel",
+    "stbId", "organisationCode", "publicName", "mainCategory", "subCategory", "website",
+    "modificationDateTimeUtc", "streetName", "streetNumber", "streetNumberAddition",
+    "postalCode", "city", "province", "phoneNumber", "lat", "lng", "museumCardFromDateTime",
+    "museumCardToDateTime", "openingPeriods", "urlOpeningHours", "facilities", "museumkids",
+    "latestMuseumKidsType", "prizes", "urlAdmissionFees", "published", "lastModifiedOn",
+    "createdOn", "language", "id", "created", "modified",
+]
+PROVINCES = [
+    "Groningen", "Friesland", "Drenthe", "Overijssel", "Flevoland", "Gelderland",
+    "Utrecht", "Noord-Holland", "Zuid-Holland", "Zeeland", "Noord-Brabant", "Limburg",
+]
+N_TOPICS = 30
+N_WORDS = 2_000  # size of the description vocabulary
+MEAN_VISITS = 6
+
+
+def _uuids(rng: np.random.Generator, n: int) -> list[str]:
+    hexes = rng.integers(0, 16, size=(n, 32))
+    digits = np.array(list("0123456789abcdef"))[hexes]
+    return [
+        f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+        for h in ("".join(row) for row in digits)
+    ]
+
+
+def _yyyymmdd(days: np.ndarray, start: str) -> np.ndarray:
+    # Dates as the integers of visits.csv, e.g. 20230131
+    dates = np.datetime64(start, "D") + days
+    years = dates.astype("datetime64[Y]").astype(int) + 1970
+    months = dates.astype("datetime64[M]").astype(int) % 12 + 1
+    day = (dates - dates.astype("datetime64[M]")).astype(int) + 1
+    return years * 10_000 + months * 100 + day
+
+
+def generate(output: str, n_members: int, n_museums: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(output, exist_ok=True)
+
+    # Cities, spread over the Netherlands
+    n_cities = max(20, n_museums // 2)
+    city_names = np.array([f"PLAATS {i}" for i in range(n_cities)], dtype=object)
+    city_lats = rng.uniform(50.8, 53.5, n_cities)
+    city_lons = rng.uniform(3.4, 7.2, n_cities)
+    pd.DataFrame({"city": city_names, "lat": city_lats, "lon": city_lons}).to_csv(
+        os.path.join(output, "cities_grouped.csv"), index=False
+    )
+
+    # Museums, a few cities have many of them
+    words = np.array([f"woord{i}" for i in range(N_WORDS)], dtype=object)
+    word_weights = 1 / np.arange(1, N_WORDS + 1)
+    word_weights /= word_weights.sum()
+    city_weights = 1 / np.arange(1, n_cities + 1) ** 0.8
+    city_weights /= city_weights.sum()
+    museum_cities = rng.choice(n_cities, n_museums, p=city_weights)
+    names = [f"Museum {i}" for i in range(n_museums)]
+    ids = [f"m{i}" for i in range(n_museums)]
+    images = _uuids(rng, n_museums)
+    museum_nouns = [
+        sorted(set(rng.choice(words, rng.integers(3, 40), p=word_weights)))
+        for _ in range(n_museums)
+    ]
+    descriptions = [" ".join(nouns) for nouns in museum_nouns]
+    museums = pd.DataFrame(
+        {
+            "_id": ids,
+            "type": "museum",
+            "teaser": [f"Teaser van {name}" for name in names],
+            "description": descriptions,
+            "impressionCarrousel": [str([{"id": image}]) for image in images],
+            "publicName": names,
+            "mainCategory": rng.choice(["Kunst", "Historie", "Natuur", "Techniek"], n_museums),
+            "city": city_names[museum_cities],
+            "province": rng.choice(PROVINCES, n_museums),
+            "lat": city_lats[museum_cities] + rng.normal(0, 0.01, n_museums),
+            "lng": city_lons[museum_cities] + rng.normal(0, 0.01, n_museums),
+            "published": rng.random(n_museums) < 0.95,
+            "id": ids,
+        },
+        columns=MUSEUM_COLUMNS,
+    )
+    # Every museum is in the file in Dutch and in English
+    pd.concat([museums.assign(language="nl"), museums.assign(language="en")]).to_csv(
+        os.path.join(output, "museums.csv"), index=False
+    )
+
+    popularity = rng.lognormal(6, 1.5, n_museums)
+    pd.DataFrame(
+        {
+            "publicName": names,
+            "Nouns": [str(nouns) for nouns in museum_nouns],
+            "n_visits": popularity.astype(int) + 1,
+        }
+    ).to_csv(os.path.join(output, "museum_nouns_and_visits.csv"), index=False)
+    write_noun_index(
+        {
+            name: {"hash": description_hash(description), "nouns": nouns}
+            for name, description, nouns in zip(names, descriptions, museum_nouns)
+        },
+        os.path.join(output, "description_nouns.json"),
+    )
+
+    # Events, about three per museum, from 2022 until 2028 so that many are active
+    n_events = 3 * n_museums
+    starts = np.datetime64("2022-01-01") + rng.integers(0, 5 * 365, n_events)
+    ends = starts + rng.integers(14, 700, n_events)
+    end_dates = pd.Series(pd.to_datetime(ends).strftime("%Y-%m-%dT00:00:00+02:00"))
+    end_dates[rng.random(n_events) < 0.1] = None  # permanent exhibitions
+    events = pd.DataFrame(
+        {
+            "name": [f"Tentoonstelling {i}" for i in range(n_events)],
+            "id": [f"e{i}" for i in range(n_events)],
+            "description": "Beschrijving",
+            "startDate": pd.to_datetime(starts).strftime("%Y-%m-%dT00:00:00+02:00"),
+            "endDate": end_dates,
+            "museumId": np.array(ids, dtype=object)[rng.integers(0, n_museums, n_events)],
+            "topicIds": [
+                str(sorted(rng.choice(np.arange(1, N_TOPICS + 1), k, replace=False).tolist()))
+                for k in rng.integers(0, 4, n_events)
+            ],
+        }
+    )
+    pd.concat([events.assign(language="nl"), events.assign(language="en")]).to_csv(
+        os.path.join(output, "events.csv"), index=False
+    )
+    pd.DataFrame(
+        {"id": np.arange(1, N_TOPICS + 1), "title": [f"Thema {i}" for i in range(1, N_TOPICS + 1)]}
+    ).to_csv(os.path.join(output, "topics.csv"), index=False)
+
+    # Members living in the cities, and their visits to (mostly popular) museums
+    person_ids = np.array([f"P{i:08d}" for i in range(n_members)], dtype=object)
+    residences = rng.choice(n_cities, n_members, p=city_weights)
+    pd.DataFrame(
+        {
+            "PersonID": person_ids,
+            # Like the real data, the residences are not upper-cased
+            "Woonplaats": [name.title() for name in city_names[residences]],
+            "Provincie": rng.choice(PROVINCES, n_members),
+            "Leeftijd": rng.integers(16, 90, n_members),
+        }
+    ).to_csv(os.path.join(output, "members.csv"), index=False)
+
+    counts = rng.poisson(MEAN_VISITS, n_members)
+    visit_museums = rng.choice(n_museums, counts.sum(), p=popularity / popularity.sum())
+    pd.DataFrame(
+        {
+            "PersonID": np.repeat(person_ids, counts),
+            "BezoekDatum": _yyyymmdd(rng.integers(0, 6 * 365, counts.sum()), "2018-01-01"),
+            "MuseumCode": visit_museums,
+            "MuseumNaam": np.array(names, dtype=object)[visit_museums],
+        }
+    ).to_csv(os.path.join(output, "visits.csv"), index=False)
+
+    with open(os.path.join(output, "synthetic.json"), "w") as file:
+        json.dump({"members": n_members, "museums": n_museums, "seed": seed}, file)
+
+
+def is_generated(output: str, n_members: int, n_museums: int, seed: int = 0) -> bool:
+    # The marker file is written last, so an interrupted run is generated again
+    try:
+        with open(os.path.join(output, "synthetic.json")) as file:
+            return json.load(file) == {"members": n_members, "museums": n_museums, "seed": seed}
+    except (OSError, ValueError):
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--members", type=int, default=None)
+    parser.add_argument("--museums", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    n_members, n_museums = SCALES[args.scale]
+    n_members = args.members or n_members
+    n_museums = args.museums or n_museums
+    output = args.output or os.path.join(".benchmarks", "data", args.scale)
+    generate(output, n_members, n_museums, args.seed)
+    print(f"Synthetic dataset with {n_members} members and {n_museums} museums written to '{output}'.")
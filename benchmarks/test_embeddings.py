@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from embeddings import ExactIndex, IVFIndex, normalise
+from evaluation_validation_perfect_matches import run_evaluation
+
+N_VECTORS = 50_000
+N_QUERIES = 200
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    # Clustered unit vectors, like the vectors of a large catalogue
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(100, 64))
+    vectors = centres[rng.integers(0, 100, N_VECTORS)]
+    vectors += rng.normal(scale=0.5, size=(N_VECTORS, 64))
+    return normalise(vectors.astype(np.float32))
+
+
+@pytest.mark.parametrize("index_type", [ExactIndex, IVFIndex])
+def test_search(benchmark, vectors, index_type):
+    index = index_type(vectors)
+    exact = ExactIndex(vectors)
+    candidates = np.ones(len(vectors), dtype=bool)
+    queries = iter(vectors[:N_QUERIES].tolist() * 1000)
+    benchmark(lambda: index.search(np.array(next(queries), dtype=np.float32), candidates, 10))
+
+    # Share of the exact top 10 the index finds
+    found = [
+        len(
+            set(index.search(query, candidates, 10)[0])
+            & set(exact.search(query, candidates, 10)[0])
+        )
+        for query in vectors[:N_QUERIES]
+    ]
+    benchmark.extra_info["recall_at_10"] = sum(found) / (10 * N_QUERIES)
+
+
+def test_recall_similar_museums_vs_perfect_matches(benchmark):
+    # The recall on the held out visits from the evaluation harness, see extra_info
+    rows = benchmark.pedantic(
+        run_evaluation,
+        args=(200, 5, 0.2),
+        kwargs={
+            "methods": ["perfect_matches", "similar_museums"],
+            "processes": 1,
+            "seed": 0,
+            "output": None,
+        },
+        rounds=1,
+        iterations=1,
+    )
+    for row in rows:
+        benchmark.extra_info[f"recall_{row['recommender_method']}"] = row["recall"]
+        benchmark.extra_info[f"users_per_second_{row['recommender_method']}"] = row[
+            "users_per_second"
+        ]
@@ -0,0 +1,8 @@
+from benchmarks.importtime import IMPORT_TIME_BUDGET, LAZY_MODULES, measure, report, total
+
+
+def test_import_app_within_budget():
+    imports, modules = measure("app")
+    # Loading the data or spaCy at import would make every process start slowly
+    assert not [name for name in LAZY_MODULES if name in modules]
+    assert total(imports, "app") <= IMPORT_TIME_BUDGET, report(imports)
@@ -0,0 +1,65 @@
+import itertools
+
+import pytest
+
+from data import User, user_store
+from recommenders import RecSystem
+
+N_USERS = 100
+
+
+@pytest.fixture(scope="module")
+def rs():
+    return RecSystem()
+
+
+@pytest.fixture(scope="module")
+def person_ids():
+    # Members with visits, spread over the store
+    step = max(1, len(user_store.person_ids) // N_USERS)
+    return [str(person_id) for person_id in user_store.person_ids[::step][:N_USERS]]
+
+
+@pytest.fixture(scope="module")
+def contexts(rs, person_ids):
+    users = [User(person_id) for person_id in person_ids]
+    return [(user, rs.build_context(user)) for user in users]
+
+
+def test_user(benchmark, person_ids):
+    ids = itertools.cycle(person_ids)
+    benchmark(lambda: User(next(ids)))
+
+
+def test_build_context(benchmark, rs, contexts):
+    users = itertools.cycle([user for user, _ in contexts])
+    benchmark(lambda: rs.build_context(next(users)))
+
+
+def test_get_relevant_museums(benchmark, rs, contexts):
+    users = itertools.cycle([user for user, _ in contexts])
+    benchmark(lambda: rs.get_relevant_museums(next(users)))
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    ["perfect_matches", "hidden_gems", "local_spots", "similar_museums", "also_visited"],
+)
+def test_strategy(benchmark, rs, contexts, strategy):
+    method = getattr(rs, strategy)
+    pairs = itertools.cycle(contexts)
+    benchmark(lambda: method(*next(pairs)))
+
+
+def test_recommend_all(benchmark, rs, contexts):
+    users = itertools.cycle([user for user, _ in contexts])
+    benchmark(lambda: rs.recommend_all(next(users)))
+
+
+def test_recommend_batch(benchmark, rs, person_ids):
+    # All users in one chunk, compare with N_USERS times test_recommend_all
+    benchmark(lambda: rs.recommend_batch(person_ids))
+
+
+def test_museum_events(benchmark, rs):
+    benchmark(lambda: [museum.events for museum in rs.all_museums])
@@ -0,0 +1,30 @@
+import itertools
+
+import pytest
+
+from data import user_store
+
+N_USERS = 100
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    # Importing the app instruments the recommenders (see metrics.py), so this module runs
+    # after test_recommenders.py
+    import app
+
+    return app
+
+
+def test_recommendations_request(benchmark, app_module):
+    client = app_module.app.test_client()
+    step = max(1, len(user_store.person_ids) // N_USERS)
+    ids = itertools.cycle(user_store.person_ids[::step][:N_USERS])
+
+    def request():
+        # Every request computes its recommendations, instead of hitting the cache
+        app_module.rec_cache.invalidate()
+        response = client.get(f"/recommendations/{next(ids)}")
+        assert response.status_code == 200
+
+    benchmark(request)
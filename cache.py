@@ -0,0 +1,155 @@
+"""
+Caches for the recommendations of a member and for the rendered museum cards.
+
+A member's visit history rarely changes, so the recommendations are cached per PersonID
+with a bounded size (least recently used entries are evicted first) and a time to live.
+"""
+
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.environ.get("RECOMMENDATION_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.environ.get("RECOMMENDATION_CACHE_TTL", 3600))  # seconds
+# Members with a generation (see invalidate) that are tracked, per entry of the cache
+GENERATIONS_PER_ENTRY = 8
+
+
+class RecommendationCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Entries are keyed by (person_id, data version), so a new version of the data
+        # never serves recommendations computed on the old one
+        self.version = 0
+        # Bumped per member by invalidate(person_id), for values computed before it. Cleared
+        # by a global invalidate, and at most GENERATIONS_PER_ENTRY * maxsize members long.
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version_of(self, person_id: str) -> tuple:
+        # The version of the data a value for this member is computed from
+        return self.version, self._generations.get(person_id, 0)
+
+    def get(self, person_id: str):
+        # Returns the cached value, or None on a miss
+        with self._lock:
+            key = (person_id, self.version_of(person_id))
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, person_id: str, value, version: tuple = None):
+        with self._lock:
+            current = self.version_of(person_id)
+            if version is not None and version != current:
+                # The data changed while the value was computed
+                return
+            key = (person_id, current)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, person_id: str, compute):
+        version = self.version_of(person_id)
+        value = self.get(person_id)
+        if value is None:
+            value = compute()
+            self.set(person_id, value, version)
+        return value
+
+    def invalidate(self, person_id: str = None):
+        """
+        Drop the cached recommendations of a member, or of everyone when no person_id is
+        given (e.g. after the visits or events data are reloaded).
+        """
+        with self._lock:
+            if person_id is None or (
+                person_id not in self._generations
+                and len(self._generations) >= GENERATIONS_PER_ENTRY * self.maxsize
+            ):
+                # The new version already makes every older key miss, so the generations
+                # are not needed anymore
+                self.version += 1
+                self._entries.clear()
+                self._generations.clear()
+            else:
+                self._entries.pop((person_id, self.version_of(person_id)), None)
+                self._generations[person_id] = self._generations.get(person_id, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CardCache:
+    """
+    The parts of a museum card that are the same for every user, rendered once per museum.
+
+    The parts are cached per catalogue, so a new version of the data renders them again, and
+    per museum with the active event the card shows, so a card is rendered again when that
+    event ends. The distance and the "New exhibition" flag are filled in around them.
+    """
+
+    def __init__(self, render):
+        """
+        Parameters:
+        render (callable): Renders the parts of a card from the museum and its active events.
+        """
+        self.render = render
+        # MuseumCatalogue -> {museum id: (id of the first active event, parts)}
+        self._parts = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, museum):
+        events = museum.events
+        state = events[0].id if events else None
+        with self._lock:
+            parts = self._parts.setdefault(museum.catalogue, {})
+            cached = parts.get(museum.id)
+            if cached is not None and cached[0] == state:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        # Rendered outside the lock, so concurrent misses of one card may each render it
+        rendered = self.render(museum, events)
+        with self._lock:
+            parts[museum.id] = (state, rendered)
+        return rendered
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": sum(len(parts) for parts in self._parts.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,244 @@
+"""
+Item-item co-visitation of the museums, for the also_visited recommender.
+
+Two museums are co-visited when the same member visited both. Every visit is weighted by
+its age (halved every HALF_LIFE_DAYS), so recent visits count more. The co-visits are
+normalised like a cosine similarity, so popular museums are not the neighbours of every
+museum, and only the TOP_K neighbours of every museum are kept. The matrix is built with
+the snapshot (see snapshot.py), before a reloaded version of the data is swapped in, or with:
+
+    python covisitation.py --processes 8
+
+It only depends on visits.csv, so it is kept when the other files change.
+
+The members are read from the user store in chunks, which are spread over a pool of
+processes. A chunk is a sparse member × museum matrix of visit weights, multiplied with
+itself, so memory is bounded by the chunk size and the museum × museum matrix.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from nouns import DATA_DIR
+from userstore import UserStore
+
+COVISITATION_PATH = os.path.join(DATA_DIR, "covisitation.npz")
+# Bump this when the way the matrix is built changes, so that old files are rebuilt
+COVISITATION_VERSION = 1
+HALF_LIFE_DAYS = 365
+TOP_K = 50
+CHUNK_MEMBERS = 50_000
+
+# The user store shared with the worker processes, which are forked
+_store = None
+
+
+def visit_weights(dates: np.ndarray, reference: np.datetime64, half_life_days: float):
+    age_days = (reference - dates) / np.timedelta64(1, "D")
+    return 0.5 ** (np.maximum(age_days, 0) / half_life_days)
+
+
+def _count_chunk(job: tuple) -> sparse.csr_matrix:
+    # The weighted co-visits of the members start:end of the user store
+    start, end, reference, half_life_days = job
+    offsets = np.asarray(_store.visit_offsets[start : end + 1])
+    first, last = offsets[0], offsets[-1]
+    visits = sparse.csr_matrix(
+        (
+            visit_weights(_store.visit_dates[first:last], reference, half_life_days),
+            (
+                np.repeat(np.arange(end - start), np.diff(offsets)),
+                _store.visit_museums[first:last],
+            ),
+        ),
+        shape=(end - start, len(_store.museum_names)),
+    )
+    return (visits.T @ visits).tocsr()
+
+
+def top_k_rows(matrix: sparse.csr_matrix, k: int) -> sparse.csr_matrix:
+    # Keep the k highest values of every row
+    indptr, indices, data = [0], [], []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        columns, values = matrix.indices[start:end], matrix.data[start:end]
+        if len(values) > k:
+            best = np.argpartition(-values, k - 1)[:k]
+            columns, values = columns[best], values[best]
+        order = np.argsort(columns)
+        indices.extend(columns[order].tolist())
+        data.extend(values[order].tolist())
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), indices, indptr), shape=matrix.shape
+    )
+
+
+class Covisitation:
+    def __init__(self, names: list, matrix: sparse.csr_matrix):
+        """
+        Parameters:
+        names (list): The museum names of the rows and columns.
+        matrix (sparse.csr_matrix): The similarity of every museum to its top neighbours.
+        """
+        self.names = list(names)
+        self.row_of = {name: row for row, name in enumerate(self.names)}
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.names)
+
+    def scores(self, names: list[str]) -> np.ndarray:
+        # The sum of the neighbour rows of the given museums
+        rows = [self.row_of[name] for name in set(names) if name in self.row_of]
+        scores = np.zeros(len(self.names))
+        for row in rows:
+            start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+            scores[self.matrix.indices[start:end]] += self.matrix.data[start:end]
+        return scores
+
+    def top(self, scores: np.ndarray, candidates: np.ndarray, n: int) -> list[str]:
+        # The n candidates with the highest positive score, ties in the order of the rows
+        rows = np.flatnonzero(candidates & (scores > 0))
+        order = np.lexsort((rows, -scores[rows]))[:n]
+        return [self.names[rows[i]] for i in order]
+
+    def save(self, path: str, key: str):
+        np.savez(
+            path,
+            names=np.array(self.names, dtype=str),
+            indptr=self.matrix.indptr,
+            indices=self.matrix.indices,
+            data=self.matrix.data,
+            key=np.array(key),
+        )
+
+    @classmethod
+    def load(cls, path: str, key: str) -> "Covisitation":
+        # Returns None when the file is missing or was built from other data or settings
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                if str(stored["key"]) != key:
+                    return None
+                names = stored["names"].tolist()
+                matrix = sparse.csr_matrix(
+                    (stored["data"], stored["indices"], stored["indptr"]),
+                    shape=(len(names), len(names)),
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(names, matrix)
+
+
+def build_covisitation(
+    store: UserStore,
+    half_life_days: float = HALF_LIFE_DAYS,
+    top_k: int = TOP_K,
+    chunk_members: int = CHUNK_MEMBERS,
+    processes: int = 1,
+) -> Covisitation:
+    global _store
+    _store = store
+
+    n_members = len(store.person_ids)
+    # The ages of the visits are relative to the latest visit, so a rebuild of the same
+    # data gives the same matrix
+    reference = np.max(store.visit_dates) if n_members else np.datetime64("now")
+    jobs = [
+        (start, min(start + chunk_members, n_members), reference, half_life_days)
+        for start in range(0, n_members, chunk_members)
+    ]
+
+    n_museums = len(store.museum_names)
+    totals = sparse.csr_matrix((n_museums, n_museums))
+    if processes == 1 or len(jobs) <= 1:
+        for job in jobs:
+            totals = totals + _count_chunk(job)
+    else:
+        with ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            for counts in executor.map(_count_chunk, jobs):
+                totals = totals + counts
+
+    # Cosine normalisation by the (weighted) number of visits of both museums
+    totals = totals.tocoo()
+    visits = np.sqrt(totals.diagonal())
+    off_diagonal = totals.row != totals.col
+    rows, columns = totals.row[off_diagonal], totals.col[off_diagonal]
+    similarities = sparse.csr_matrix(
+        (totals.data[off_diagonal] / (visits[rows] * visits[columns]), (rows, columns)),
+        shape=totals.shape,
+    )
+    return Covisitation(store.museum_names, top_k_rows(similarities, top_k))
+
+
+def covisitation_key(visits_version: str) -> str:
+    # Identifies the visits and the settings a stored matrix is built from
+    return json.dumps([COVISITATION_VERSION, visits_version, HALF_LIFE_DAYS, TOP_K])
+
+
+def save_covisitation(
+    covisitation: Covisitation, visits_version: str, path: str = COVISITATION_PATH
+):
+    try:
+        covisitation.save(path, covisitation_key(visits_version))
+    except OSError as e:
+        print(f"Could not write the co-visitation matrix: {e}", file=sys.stderr)
+
+
+def load_covisitation(
+    store: UserStore,
+    visits_version: str,
+    build: bool = False,
+    path: str = COVISITATION_PATH,
+) -> Covisitation:
+    """
+    Load the co-visitation matrix of this version of visits.csv.
+
+    Parameters:
+    build (bool): Build (and store) the matrix when it is missing or stale. Otherwise an
+    empty matrix is returned, so no museums are recommended from it.
+    """
+    covisitation = Covisitation.load(path, covisitation_key(visits_version))
+    if covisitation is not None:
+        return covisitation
+    if not build:
+        print(
+            "The co-visitation matrix is missing or stale, build it with "
+            "'python covisitation.py' or reload the data",
+            file=sys.stderr,
+        )
+        n_museums = len(store.museum_names)
+        return Covisitation(store.museum_names, sparse.csr_matrix((n_museums, n_museums)))
+
+    print(f"Building the co-visitation of {len(store.museum_names)} museums", file=sys.stderr)
+    # In one process, the app's threads make forking it unsafe
+    covisitation = build_covisitation(store)
+    save_covisitation(covisitation, visits_version, path)
+    return covisitation
+
+
+if __name__ == "__main__":
+    from data import get_context
+    from snapshot import data_version
+
+    parser = argparse.ArgumentParser(description="Build the museum co-visitation matrix.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-members", type=int, default=CHUNK_MEMBERS)
+    parser.add_argument("--output", default=COVISITATION_PATH)
+    args = parser.parse_args()
+
+    visits_version = data_version(["visits"])
+    covisitation = build_covisitation(
+        get_context().user_store, chunk_members=args.chunk_members, processes=args.processes
+    )
+    covisitation.save(args.output, covisitation_key(visits_version))
+    print(f"Co-visitation of {len(covisitation)} museums written to '{args.output}'.")
@@ -1,47 +1,395 @@
 from collections import namedtuple
-from dataclasses import dataclass
+from contextlib import contextmanager
+import json
 import os
 import re
 import sys
+import threading
+import numpy as np
 import pandas as pd
-import spacy
-
-# Ensure that the data is loaded only once
-members_df = pd.read_csv(
-    "data/members.csv",
-    usecols=["PersonID", "Woonplaats", "Provincie", "Leeftijd"],
-)
-visits_df = pd.read_csv(
-    "data/visits.csv",
-    usecols=[
-        "PersonID",
-        "BezoekDatum",
-        "MuseumCode",
-        "MuseumNaam",
-    ],
-)
-# If the user has visited a museum more than once, we only keep the most recent visit
-visits_df = visits_df.sort_values(by=["PersonID", "BezoekDatum"], ascending=False)
-visits_df = visits_df.drop_duplicates(subset=["PersonID", "MuseumNaam"])
-
-museums_df = pd.read_csv("data/museums.csv")
-museums_df = museums_df[museums_df["language"] == "nl"]
-museums_df["city"] = museums_df["city"].str.lower()
-
-# List of museums which no longer exists, so we remove them from the dataset
-old_museums = ["Wereld van Wenters"]
-museums_df = museums_df[~museums_df["publicName"].isin(old_museums)]
-
-events_df = pd.read_csv("data/events.csv")
-topics_df = pd.read_csv("data/topics.csv")
-
-# Load the Dutch language model
-NLP_DUTCH = spacy.load("nl_core_news_sm")
-
-
-def is_valid_img_uuid(uuid_str: str) -> bool:
-    # There should be an image named {uuid}.jpg in the static/museum_images folder
-    return os.path.exists(f"static/museum_images/{uuid_str}.jpg")
+
+from covisitation import load_covisitation
+from embeddings import load_embeddings
+from events import Event, EventIndex, Topic
+from geo import CityCoordinates
+from nouns import extract_nouns, load_noun_index
+from snapshot import data_version, load_table, load_user_store
+
+# The museums.csv columns, in order
+MUSEUM_FIELDS = [
+    "id2",
+    "type",
+    "teaser",
+    "metaDescription",
+    "description",
+    "kidsDescription",
+    "museumColor",
+    "showpieceIds",
+    "impressionCarrousel",
+    "museumHighlightsCarrousel",
+    "stbId",
+    "organisationCode",
+    "publicName",
+    "mainCategory",
+    "subCategory",
+    "website",
+    "modificationDateTimeUtc",
+    "streetName",
+    "streetNumber",
+    "streetNumberAddition",
+    "postalCode",
+    "city",
+    "province",
+    "phoneNumber",
+    "lat",
+    "lng",
+    "museumCardFromDateTime",
+    "museumCardToDateTime",
+    "openingPeriods",
+    "urlOpeningHours",
+    "facilities",
+    "museumkids",
+    "latestMuseumKidsType",
+    "prizes",
+    "urlAdmissionFees",
+    "published",
+    "lastModifiedOn",
+    "createdOn",
+    "language",
+    "id3",
+    "created",
+    "modified",
+]
+
+IMAGE_DIR = "static/museum_images"
+# Shown for museums without an image in IMAGE_DIR
+PLACEHOLDER_IMAGE_URL = "/static/img/museum.jpeg"
+UUID_REGEX = r"[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}"
+
+
+def available_images(directory: str = IMAGE_DIR) -> set:
+    # The uuids of the images named {uuid}.jpg in the directory, scanned once
+    try:
+        return {
+            entry.name[: -len(".jpg")]
+            for entry in os.scandir(directory)
+            if entry.name.endswith(".jpg") and entry.is_file()
+        }
+    except FileNotFoundError:
+        return set()
+
+
+# The popularity quantiles of which the tiers are precomputed, see PopularityTiers
+POPULARITY_QUANTILES = (0.25, 0.5, 0.75, 0.8, 0.9)
+
+
+class PopularityTiers:
+    """
+    The number of visits of every museum in the catalogue, with a mask over the museum ids
+    of the museums below every configured quantile of the visit counts, so selecting the
+    less popular museums is a mask AND.
+    """
+
+    def __init__(self, visits: np.ndarray, counts, quantiles=POPULARITY_QUANTILES):
+        """
+        Parameters:
+        visits (np.ndarray): The number of visits of every museum id, NaN when unknown.
+        counts: The visit counts the quantiles are taken over (n_visits of museum_nouns).
+        """
+        self.visits = visits
+        self.counts = np.sort(pd.Series(counts).dropna().to_numpy(dtype=float))
+        self.tiers = {quantile: self._below(quantile) for quantile in quantiles}
+
+    def threshold(self, quantile: float) -> float:
+        # The same value as Series.quantile gives (linear interpolation)
+        return float(np.quantile(self.counts, quantile))
+
+    def _below(self, quantile: float) -> np.ndarray:
+        return self.visits < self.threshold(quantile)
+
+    def below(self, quantile: float) -> np.ndarray:
+        # Mask of the museums with fewer visits than the quantile, computed for other quantiles
+        tier = self.tiers.get(quantile)
+        return tier if tier is not None else self._below(quantile)
+
+
+class MuseumCatalogue:
+    """
+    The static attributes of all museums, stored once per column.
+
+    A museum is addressed by its integer id, its row in the catalogue. Museum objects are
+    lightweight views on a row, so they can be created per user without copying the data.
+    """
+
+    def __init__(self, museums_df, event_index: EventIndex = None, noun_index: dict = None):
+        # The events and description nouns of the same version of the data
+        self.event_index = event_index
+        self.noun_index = noun_index if noun_index is not None else {}
+        self.columns = {
+            field: museums_df.iloc[:, position].tolist()
+            for position, field in enumerate(MUSEUM_FIELDS)
+        }
+        self.lats = museums_df.iloc[:, MUSEUM_FIELDS.index("lat")].to_numpy(dtype=float)
+        self.lngs = museums_df.iloc[:, MUSEUM_FIELDS.index("lng")].to_numpy(dtype=float)
+
+        self.ids_by_name = {}
+        for museum_id, name in enumerate(self.columns["publicName"]):
+            self.ids_by_name.setdefault(name, []).append(museum_id)
+
+        self.image_urls = [None] * len(self)
+        self.missing_images = []
+        self.popularity = None
+
+    def set_popularity(self, museums_short: pd.DataFrame):
+        # (Re)compute the popularity tiers from the n_visits of museum_nouns_and_visits.csv
+        n_visits = dict(zip(museums_short["publicName"], museums_short["n_visits"]))
+        visits = np.array(
+            [n_visits.get(name, np.nan) for name in self.columns["publicName"]], dtype=float
+        )
+        self.popularity = PopularityTiers(visits, museums_short["n_visits"])
+
+    def resolve_image_urls(self, images: set):
+        """
+        Find the image of every museum: the first uuid in its impressionCarrousel for which
+        there is an image named {uuid}.jpg in the static/museum_images folder. Museums
+        without an image get the placeholder image.
+        """
+        self.missing_images = []
+        for museum_id, carrousel in enumerate(self.columns["impressionCarrousel"]):
+            for match in re.finditer(UUID_REGEX, str(carrousel)):
+                if match.group() in images:
+                    self.image_urls[museum_id] = f"/{IMAGE_DIR}/{match.group()}.jpg"
+                    break
+            else:
+                self.image_urls[museum_id] = PLACEHOLDER_IMAGE_URL
+                self.missing_images.append(self.columns["publicName"][museum_id])
+
+        if self.missing_images:
+            # Reported once at startup, instead of on every render
+            print(
+                json.dumps(
+                    {"warning": "missing_museum_images", "museums": self.missing_images}
+                ),
+                file=sys.stderr,
+            )
+
+    def __len__(self):
+        return len(self.columns["publicName"])
+
+    def museum(self, museum_id: int, **user_fields) -> "Museum":
+        return Museum(self, museum_id, **user_fields)
+
+
+class lazy:
+    """
+    A table or index of a DataContext, loaded on first use and then kept. Requests that
+    need it at the same time wait for one load.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.name = load.__name__
+        self.__doc__ = load.__doc__
+
+    def __get__(self, context, owner=None):
+        if context is None:
+            return self
+        with context._load_lock:
+            if self.name not in context.__dict__:
+                context.__dict__[self.name] = self.load(context)
+        return context.__dict__[self.name]
+
+
+class DataContext:
+    """
+    One version of the data: all tables and the indexes built from them.
+
+    The app reads the data through the current context (get_context()). reload_context()
+    builds a new context next to it and then swaps it in at once, so a request that already
+    holds the old context (e.g. through its User or RecSystem) finishes on the old version.
+
+    The tables are loaded on first use, so e.g. the city coordinates do not need the visits.
+    """
+
+    def __init__(self):
+        # Identifies the source files the context is built from, e.g. for cache keys
+        self.version = data_version()
+        self.loaded_at = pd.Timestamp.now()
+        self._load_lock = threading.RLock()
+        # Set by load(), which may build what is too slow to build on a request
+        self._preloading = False
+
+    # What serving requests needs. The members and visits tables are left out: the requests
+    # read the members and their visits from the user store.
+    SERVING_ATTRIBUTES = (
+        "museums_df",
+        "events_df",
+        "topics_df",
+        "cities_df",
+        "museums_short",
+        "museums_dict",
+        "city_coordinates",
+        "event_index",
+        "noun_index",
+        "museum_vectors",
+        "catalogue",
+        "user_store",
+        "covisitation",
+    )
+
+    def load(self) -> "DataContext":
+        # Load what serving needs now, e.g. before the context is swapped in
+        self._preloading = True
+        try:
+            for name in self.SERVING_ATTRIBUTES:
+                getattr(self, name)
+        finally:
+            self._preloading = False
+        return self
+
+    # The tables, loaded from the snapshot when it is up to date
+    @lazy
+    def members_df(self):
+        return load_table("members")
+
+    @lazy
+    def visits_df(self):
+        # If the user has visited a museum more than once, only the most recent visit is kept
+        return load_table("visits")
+
+    @lazy
+    def museums_df(self):
+        return load_table("museums")
+
+    @lazy
+    def events_df(self):
+        return load_table("events")
+
+    @lazy
+    def topics_df(self):
+        return load_table("topics")
+
+    @lazy
+    def cities_df(self):
+        return load_table("cities")
+
+    @lazy
+    def museums_short(self):
+        return load_table("museum_nouns")
+
+    # The indexes built from the tables
+    @lazy
+    def museums_dict(self):
+        return self.museums_short.set_index("publicName").to_dict("index")
+
+    @lazy
+    def city_coordinates(self):
+        return CityCoordinates(self.cities_df)
+
+    @lazy
+    def event_index(self):
+        return EventIndex(self.events_df, self.topics_df)
+
+    @lazy
+    def noun_index(self):
+        # The nouns of every museum description, extracted offline (see nouns.py)
+        return load_noun_index(
+            dict(zip(self.museums_df["publicName"], self.museums_df["description"]))
+        )
+
+    @lazy
+    def museum_vectors(self):
+        # Dense vectors of the museums in museums_dict, built offline (see embeddings.py)
+        return load_embeddings(
+            {name: museum["Nouns"] for name, museum in self.museums_dict.items()}
+        )
+
+    @lazy
+    def catalogue(self):
+        catalogue = MuseumCatalogue(self.museums_df, self.event_index, self.noun_index)
+        catalogue.resolve_image_urls(available_images())
+        catalogue.set_popularity(self.museums_short)
+        return catalogue
+
+    @lazy
+    def user_store(self):
+        # The members and visit tables are only read when the snapshot is not up to date,
+        # and are not kept once the store is built from them
+        return load_user_store(lambda: (load_table("members"), load_table("visits")))
+
+    @lazy
+    def covisitation(self):
+        # The museums visited by the same members (see covisitation.py). Only load() builds
+        # it when it is missing, on a request it is empty until then.
+        return load_covisitation(
+            self.user_store, data_version(["visits"]), build=self._preloading
+        )
+
+
+_context = None
+# Held while the current context is replaced, or while visits are added to it
+_swap_lock = threading.RLock()
+
+
+def get_context() -> DataContext:
+    # The current version of the data, loaded on first use
+    global _context
+    if _context is None:
+        with _swap_lock:
+            if _context is None:
+                _context = DataContext()
+    return _context
+
+
+def set_context(context: DataContext) -> DataContext:
+    """
+    Make a newly loaded context the current version of the data. The visits added while
+    running (see ingest.py) are carried over to it.
+    """
+    global _context
+    with _swap_lock:
+        if _context is not None:
+            context.user_store.add_visits(
+                [
+                    (person_id, museum_name, timestamp)
+                    for person_id, visits in _context.user_store.overlay.items()
+                    for museum_name, timestamp in visits.items()
+                ]
+            )
+        _context = context
+    return context
+
+
+def reload_context() -> DataContext:
+    # Load the data again, from the snapshot when it is up to date, and swap it in
+    return set_context(DataContext().load())
+
+
+@contextmanager
+def locked_context():
+    # The current context, which is not replaced until the block ends
+    with _swap_lock:
+        yield get_context()
+
+
+# Module attributes that are read from the current context, e.g. data.members_df
+CONTEXT_ATTRIBUTES = {
+    "members_df": "members_df",
+    "visits_df": "visits_df",
+    "museums_df": "museums_df",
+    "events_df": "events_df",
+    "topics_df": "topics_df",
+    "catalogue": "catalogue",
+    "event_index": "event_index",
+    "NOUN_INDEX": "noun_index",
+    "user_store": "user_store",
+}
+
+
+def __getattr__(name: str):
+    if name in CONTEXT_ATTRIBUTES:
+        return getattr(get_context(), CONTEXT_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class User:
@@ -50,88 +398,32 @@ class User:
     age: int = None
     previous_visits: list = None
 
-    def __init__(self, person_id: str):
+    def __init__(self, person_id: str, context: DataContext = None):
         self.person_id = person_id
+        self.context = context or get_context()
+        catalogue = self.context.catalogue
 
-        personal_df = members_df[members_df.PersonID == person_id]
-        self.residence = personal_df.Woonplaats.values[0]
-        self.age = personal_df.Leeftijd.values[0]
+        self.residence, self.age = self.context.user_store.member(person_id)
 
-        # For the user class, we only need a subset of columns
-        part_of_museums_df = museums_df[
-            ["publicName", "city", "description", "mainCategory", "subCategory", "id"]
-        ]
-        personal_visits_df = visits_df[visits_df.PersonID == person_id]
-
-        museums_visited = pd.merge(
-            left=part_of_museums_df,
-            right=personal_visits_df,
-            left_on="publicName",
-            right_on="MuseumNaam",
-            how="inner",
-        )
-        museums_visited = museums_visited.drop(
-            columns=["PersonID", "MuseumNaam", "BezoekDatum"]
-        )
-        museums_visited = [
-            Museum(
-                id2=None,
-                type=None,
-                teaser=None,
-                metaDescription=None,
-                description=row["description"],
-                kidsDescription=None,
-                museumColor=None,
-                showpieceIds=None,
-                impressionCarrousel=None,
-                museumHighlightsCarrousel=None,
-                stbId=None,
-                organisationCode=None,
-                publicName=row["publicName"],
-                mainCategory=row["mainCategory"],
-                subCategory=row["subCategory"],
-                website=None,
-                modificationDateTimeUtc=None,
-                streetName=None,
-                streetNumber=None,
-                streetNumberAddition=None,
-                postalCode=None,
-                city=row["city"],
-                province=None,
-                phoneNumber=None,
-                lat=None,
-                lng=None,
-                museumCardFromDateTime=None,
-                museumCardToDateTime=None,
-                openingPeriods=None,
-                urlOpeningHours=None,
-                facilities=None,
-                museumkids=None,
-                latestMuseumKidsType=None,
-                prizes=None,
-                urlAdmissionFees=None,
-                published=None,
-                lastModifiedOn=None,
-                createdOn=None,
-                language=None,
-                id3=row["id"],
-                created=None,
-                modified=None,
-            )
-            for _, row in museums_visited.iterrows()
-        ]
+        # Join the visits with the museums they belong to, in the order of the catalogue
+        museums_visited = []
+        for museum_name, timestamp in self.context.user_store.visits(person_id):
+            for museum_id in catalogue.ids_by_name.get(museum_name, []):
+                museums_visited.append((museum_id, timestamp))
+        museums_visited.sort(key=lambda visit: visit[0])
 
         self.previous_visits = [
-            PreviousVisit(museum=museum, timestamp=timestamp)
-            for museum, timestamp in zip(
-                museums_visited,
-                pd.to_datetime(visits_df["BezoekDatum"], format="%Y%m%d"),
-            )
+            PreviousVisit(museum=catalogue.museum(museum_id), timestamp=timestamp)
+            for museum_id, timestamp in museums_visited
         ]
         self.previous_visits = sorted(
             self.previous_visits, key=lambda visit: visit.timestamp
         )
 
+    @property
+    def museum_ids(self) -> list[int]:
+        return [previous_visit.museum.id for previous_visit in self.previous_visits]
+
     def get_interests_museums(self):
         # Get the main and sub categories of museums visited by the user and save them as a tuple in the list of interests gathered through museum categories
         interests_museums = [
@@ -180,152 +472,78 @@ class User:
 
 RecommendationResult = namedtuple("RecommendationResult", ["museum", "score"])
 PreviousVisit = namedtuple("PreviousVisit", ["museum", "timestamp"])
-Topic = namedtuple("Topic", ["id", "title"])
 
 
-@dataclass
 class Museum:
-    id2: any
-    type: any
-    teaser: any
-    metaDescription: any
-    description: any
-    kidsDescription: any
-    museumColor: any
-    showpieceIds: any
-    impressionCarrousel: any
-    museumHighlightsCarrousel: any
-    stbId: any
-    organisationCode: any
-    publicName: any
-    mainCategory: any
-    subCategory: any
-    website: any
-    modificationDateTimeUtc: any
-    streetName: any
-    streetNumber: any
-    streetNumberAddition: any
-    postalCode: any
-    city: any
-    province: any
-    phoneNumber: any
-    lat: any
-    lng: any
-    museumCardFromDateTime: any
-    museumCardToDateTime: any
-    openingPeriods: any
-    urlOpeningHours: any
-    facilities: any
-    museumkids: any
-    latestMuseumKidsType: any
-    prizes: any
-    urlAdmissionFees: any
-    published: any
-    lastModifiedOn: any
-    createdOn: any
-    language: any
-    id3: any
-    created: any
-    modified: any
-
-    distance_from_user: float = None
-    prev_visit: bool = False
-    _image_url: str = None
-
-    @property
-    def image_url(self):
-        if self._image_url:
-            return self._image_url
+    """
+    A museum in the catalogue.
+
+    The static attributes are read from the catalogue. Only the attributes that depend on the
+    user (distance_from_user and prev_visit) are stored on the museum itself.
+    """
+
+    __slots__ = ("catalogue", "id", "distance_from_user", "prev_visit")
+
+    def __init__(
+        self,
+        catalogue: MuseumCatalogue,
+        id: int,
+        distance_from_user: float = None,
+        prev_visit: bool = False,
+    ):
+        self.catalogue = catalogue
+        self.id = id
+        self.distance_from_user = distance_from_user
+        self.prev_visit = prev_visit
+
+    def for_user(self, **user_fields) -> "Museum":
+        # A copy of this museum with distance_from_user and/or prev_visit set for a user
+        fields = {"distance_from_user": self.distance_from_user, "prev_visit": self.prev_visit}
+        fields.update(user_fields)
+        return Museum(self.catalogue, self.id, **fields)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Museum)
+            and self.catalogue is other.catalogue
+            and self.id == other.id
+        )
 
-        uuid_regex = r"[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}"
-        mc = self.impressionCarrousel.replace("'", '"')
+    def __hash__(self):
+        return hash(self.id)
 
-        for match in re.finditer(uuid_regex, mc):
-            if is_valid_img_uuid(match.group()):
-                self._image_url = f"/static/museum_images/{match.group()}.jpg"
-                return f"/static/museum_images/{match.group()}.jpg"
+    def __repr__(self):
+        return f"Museum(id={self.id}, publicName={self.publicName!r})"
 
-        print(f"No image found for museum {self.publicName}", file=sys.stdout)
-        return None
+    @property
+    def image_url(self):
+        # Resolved once at startup, see MuseumCatalogue.resolve_image_urls
+        return self.catalogue.image_urls[self.id]
 
     @property
     def event_topics(self):
-        # Filter events for language 'nl'
-        events_df_nl = events_df[events_df["language"] == "nl"]
-        # Filter events by museum ID
-        museum_objects = events_df_nl[events_df_nl["museumId"] == self.id3]
-
-        # Flatten all topic IDs into a list
-        all_topic_ids = []
-        for topic_list in museum_objects["topicIds"]:
-            # Assuming topicIds are stored as a string representation of a list, e.g., "[1, 2, 3]"
-            topic_ids = eval(topic_list) if isinstance(topic_list, str) else topic_list
-            all_topic_ids.extend(topic_ids)
-
-        # Count occurrences of each topic ID
-        topic_counts = pd.Series(all_topic_ids).value_counts().to_dict()
-
-        # Build the list of tuples with Topic namedtuple and counts
-        topics_list = []
-        for topic_id, count in topic_counts.items():
-            title = topics_df.loc[topics_df["id"] == topic_id, "title"].values[0]
-            topic = Topic(id=topic_id, title=title)
-            topics_list.append((topic, count))
-
-        return topics_list
+        return self.catalogue.event_index.topics(self.id3)
 
     @property
     def events(self):
-        # Filter events for language 'nl'
-        events_df_nl = events_df[events_df["language"] == "nl"]
-        # Filter events by museum ID
-        museum_objects = events_df_nl[events_df_nl["museumId"] == self.id3]
-        museum_objects["endDate"] = pd.to_datetime(
-            museum_objects["endDate"], errors="coerce"
-        )
-        museum_objects["endDate"] = museum_objects["endDate"].apply(
-            lambda x: x.replace(tzinfo=None) if pd.notnull(x) else x
-        )
-        museum_objects = museum_objects[
-            museum_objects["endDate"] > pd.Timestamp.now().replace(tzinfo=None)
-        ]
-        return [
-            Event(
-                name=row["name"],
-                id=row["id"],
-                description=row["description"],
-                startDate=row["startDate"],
-                endDate=row["endDate"],
-                museumId=row["museumId"],
-            )
-            for _, row in museum_objects.iterrows()
-        ]
+        return self.catalogue.event_index.active_events(self.id3)
 
     @property
     def description_nouns(self):
-        # If description is of type float, convert it to string
-        if isinstance(self.description, float):
-            self.description = str(self.description)
-
-        doc = NLP_DUTCH(self.description)
-        return [
-            token.text
-            for token in doc
-            if (
-                len(token.text) >= 3
-                and token.pos_ == "NOUN"
-                and token.text not in ["museum", "musea", "Museum", "Musea", "#", "‘"]
-            )
-            or token.text.isnumeric()
-            and len(token.text) in [2, 4]
-        ]
+        nouns = self.catalogue.noun_index.get(self.publicName)
+        if nouns is None:
+            # Museums that are not in the index are parsed on demand
+            nouns = extract_nouns(self.description)
+        return nouns
+
+
+def _column(field: str) -> property:
+    return property(
+        lambda museum: museum.catalogue.columns[field][museum.id],
+        doc=f"The {field} column of the catalogue.",
+    )
 
 
-@dataclass
-class Event:
-    name: any
-    id: any
-    description: any
-    startDate: any
-    endDate: any
-    museumId: any
+# Every column of the catalogue is a read-only attribute of the museums
+for _field in MUSEUM_FIELDS:
+    setattr(Museum, _field, _column(_field))
@@ -0,0 +1,239 @@
+"""
+Dense vectors of the museums for the similar_museums recommender.
+
+The description nouns (see nouns.py) are weighted with TF-IDF and reduced to a few dozen
+dimensions with a truncated SVD, so museums with related nouns get close vectors even when
+they share few nouns. The vectors are built offline and stored next to the data:
+
+    python embeddings.py --dimensions 64
+
+and are rebuilt at startup when the nouns changed. A user is the mean of the vectors of
+the museums they visited, and the closest museums to it by cosine similarity are found with
+an exact search, or with an IVF index (inverted lists over k-means clusters) for catalogues
+where the exact search gets too slow.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+from scipy import sparse
+
+from nouns import DATA_DIR
+
+EMBEDDINGS_PATH = os.path.join(DATA_DIR, "museum_embeddings.npz")
+# Bump this when the way the vectors are built changes, so that old files are rebuilt
+EMBEDDINGS_VERSION = 1
+DIMENSIONS = 64
+# Below this number of museums the exact search is faster than the IVF index
+IVF_MIN_MUSEUMS = 20_000
+
+
+def nouns_key(museum_nouns: dict, dimensions: int) -> str:
+    # Identifies the input of build_embeddings, to tell whether a stored file is stale
+    nouns = [[name, sorted(museum_nouns[name])] for name in museum_nouns]
+    content = json.dumps([EMBEDDINGS_VERSION, dimensions, nouns], ensure_ascii=False)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def build_embeddings(museum_nouns: dict, dimensions: int = DIMENSIONS) -> np.ndarray:
+    """
+    Build the TF-IDF + truncated SVD vectors of the museums.
+
+    Parameters:
+    museum_nouns (dict): Mapping of museum publicName to the nouns in its description.
+
+    Returns:
+    np.ndarray: float32 museums × dimensions array of unit vectors (zero for museums
+    without nouns), in the order of museum_nouns.
+    """
+    vocabulary = {}
+    rows, columns, counts = [], [], []
+    for row, nouns in enumerate(museum_nouns.values()):
+        unique, frequency = np.unique(
+            [vocabulary.setdefault(noun, len(vocabulary)) for noun in nouns],
+            return_counts=True,
+        )
+        rows.extend([row] * len(unique))
+        columns.extend(unique.tolist())
+        counts.extend(frequency.tolist())
+    n_museums = len(museum_nouns)
+    if not vocabulary:
+        return np.zeros((n_museums, 0), dtype=np.float32)
+
+    tf = sparse.csr_matrix(
+        (np.log1p(np.array(counts, dtype=float)), (rows, columns)),
+        shape=(n_museums, len(vocabulary)),
+    )
+    # Smoothed inverse document frequency, like the usual TF-IDF
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((1 + n_museums) / (1 + document_frequency)) + 1
+    tfidf = tf @ sparse.diags(idf)
+
+    dimensions = min(dimensions, min(tfidf.shape) - 1)
+    if dimensions < 1:
+        vectors = tfidf.toarray()
+    else:
+        from scipy.sparse.linalg import svds
+
+        # A fixed start vector, so the same nouns always give the same vectors
+        start = np.ones(min(tfidf.shape)) / np.sqrt(min(tfidf.shape))
+        u, s, _ = svds(tfidf, k=dimensions, v0=start)
+        vectors = u[:, ::-1] * s[::-1]
+    return normalise(vectors.astype(np.float32))
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def read_embeddings(path: str = EMBEDDINGS_PATH) -> dict:
+    # Returns the stored names, vectors and key, or None when the file is missing
+    try:
+        with np.load(path, allow_pickle=False) as stored:
+            return {name: stored[name] for name in ("names", "vectors", "key")}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_embeddings(
+    names: list, vectors: np.ndarray, key: str, path: str = EMBEDDINGS_PATH
+):
+    np.savez(path, names=np.array(names, dtype=str), vectors=vectors, key=np.array(key))
+
+
+def load_embeddings(
+    museum_nouns: dict, dimensions: int = DIMENSIONS, path: str = EMBEDDINGS_PATH
+) -> np.ndarray:
+    """
+    Load the vectors of the museums, building (and storing) them when they are stale.
+
+    Returns:
+    np.ndarray: The vectors in the order of museum_nouns.
+    """
+    key = nouns_key(museum_nouns, dimensions)
+    stored = read_embeddings(path)
+    if (
+        stored is not None
+        and str(stored["key"]) == key
+        and stored["names"].tolist() == list(museum_nouns)
+    ):
+        return stored["vectors"]
+
+    print(f"Building the vectors of {len(museum_nouns)} museums", file=sys.stderr)
+    vectors = build_embeddings(museum_nouns, dimensions)
+    try:
+        write_embeddings(list(museum_nouns), vectors, key, path)
+    except OSError as e:
+        print(f"Could not write the museum vectors: {e}", file=sys.stderr)
+    return vectors
+
+
+class ExactIndex:
+    """
+    Cosine similarity search over all vectors, one float32 matrix-vector product.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def search(self, query: np.ndarray, candidates: np.ndarray, n: int) -> tuple:
+        """
+        Return the rows of the n candidates closest to the query, closest first, and their
+        similarities. Ties keep the order of the rows.
+        """
+        # Usually most museums are candidates, so all similarities are computed at once
+        # instead of gathering the vectors of the candidates first
+        rows = np.flatnonzero(candidates)
+        return self._top(rows, (self.vectors @ query)[rows], n)
+
+    def _top(self, rows: np.ndarray, similarities: np.ndarray, n: int) -> tuple:
+        # The n of the given (sorted) rows with the highest similarity
+        if len(rows) > n > 0:
+            best = np.argpartition(-similarities, n - 1)[:n]
+            rows, similarities = rows[best], similarities[best]
+        order = np.lexsort((rows, -similarities))[:n]
+        return rows[order], similarities[order]
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted file index: the vectors are clustered with k-means, and a query only compares
+    the vectors in the n_probe clusters whose centroids are closest to it.
+    """
+
+    def __init__(
+        self, vectors: np.ndarray, n_lists: int = None, n_probe: int = 8, seed: int = 0
+    ):
+        super().__init__(vectors)
+        self.n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        self.n_probe = min(n_probe, self.n_lists)
+        self.centroids, assignment = kmeans(vectors, self.n_lists, seed=seed)
+
+        # The rows of every cluster, as one array with offsets
+        self.list_rows = np.argsort(assignment, kind="stable")
+        sizes = np.bincount(assignment, minlength=self.n_lists)
+        self.list_offsets = np.r_[0, np.cumsum(sizes)]
+
+    def search(self, query: np.ndarray, candidates: np.ndarray, n: int) -> tuple:
+        order = np.argsort(-(self.centroids @ query))
+        n_probe = self.n_probe
+        while True:
+            rows = np.sort(
+                np.concatenate(
+                    [
+                        self.list_rows[
+                            self.list_offsets[cluster] : self.list_offsets[cluster + 1]
+                        ]
+                        for cluster in order[:n_probe]
+                    ]
+                )
+            )
+            rows = rows[candidates[rows]]
+            # Probe more clusters when too few candidates are in the closest ones
+            if len(rows) >= n or n_probe >= self.n_lists:
+                break
+            n_probe *= 2
+        return self._top(rows, self.vectors[rows] @ query, n)
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> tuple:
+    # Spherical k-means: returns the unit centroids and the cluster of every vector
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # An empty cluster keeps its centroid
+        sums[empty] = centroids[empty]
+        centroids = normalise(sums)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+def build_index(vectors: np.ndarray) -> ExactIndex:
+    if len(vectors) >= IVF_MIN_MUSEUMS:
+        return IVFIndex(vectors)
+    return ExactIndex(vectors)
+
+
+if __name__ == "__main__":
+    from snapshot import load_table
+
+    parser = argparse.ArgumentParser(description="Build the museum vectors.")
+    parser.add_argument("--dimensions", type=int, default=DIMENSIONS)
+    parser.add_argument("--output", default=EMBEDDINGS_PATH)
+    args = parser.parse_args()
+
+    # The same nouns as the recommenders use, from museum_nouns_and_visits.csv
+    museums = load_table("museum_nouns")
+    museum_nouns = dict(zip(museums["publicName"], museums["Nouns"]))
+    vectors = build_embeddings(museum_nouns, args.dimensions)
+    key = nouns_key(museum_nouns, args.dimensions)
+    write_embeddings(list(museum_nouns), vectors, key, args.output)
+    print(f"Vectors of {len(vectors)} museums written to '{args.output}'.")
@@ -1,18 +1,72 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from recommenders import *
-from data import *
+
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
+from data import User, get_context
+from geo import haversine
+from recommenders import (
+    BOOST,
+    N_RECS,
+    QUANTILE,
+    THRESHOLD,
+    RecSystem,
+    get_city_coordinates,
+)
+from snapshot import DATA_DIR
+
+METHODS = ["perfect_matches", "hidden_gems", "local_spots", "similar_museums", "random"]
+RESULTS_PATH = os.path.join(DATA_DIR, "evaluation_results.csv")
+RESULT_FIELDS = [
+    "datetime",
+    "recommender_method",
+    "boost",
+    "threshold",
+    "quantile",
+    "n_recs",
+    "sample_size",
+    "number_of_visits_lowerbound",
+    "test_split_size",
+    "seed",
+    "TP",
+    "FP",
+    "FN",
+    "precision",
+    "recall",
+    "compute_time",
+    "wall_time",
+    "users_per_second",
+]
+
+# The RecSystem shared with the worker processes. It is created before the processes are
+# forked, so the workers use the data of the parent process instead of loading it again.
+_rec_system = None
 
-def generate_sample(sample_size: int, number_of_visits_lowerbound: int):
-    # Read the CSV and extract the "PersonID" column as a one-column dataFrame
-    personid_df = pd.read_csv("data/members.csv", usecols=["PersonID"])
 
-    personid_visits_df = (
-        pd.read_csv("data/visits.csv", usecols=["PersonID"])
-        .groupby("PersonID")
-        .size()
-        .reset_index(name="Visits")
+def sample_person_ids(
+    sample_size: int, number_of_visits_lowerbound: int, seed: int = None
+) -> list[str]:
+    context = get_context()
+    user_store = context.user_store
+
+    # The "PersonID" column of the members as a one-column dataFrame
+    personid_df = context.members_df[["PersonID"]]
+
+    # The number of (distinct) museums every member visited, from the user store
+    personid_visits_df = pd.DataFrame(
+        {
+            "PersonID": user_store.person_ids,
+            "Visits": np.diff(user_store.visit_offsets),
+        }
     )
 
     # Left join the two dataFrames on the "PersonID" column
@@ -25,78 +79,226 @@ def generate_sample(sample_size: int, number_of_visits_lowerbound: int):
     merged_df = merged_df[merged_df["Visits"] >= number_of_visits_lowerbound]
 
     # From the remaining users, randomly sample 'sample_size' users
-    sample = merged_df.sample(sample_size)
+    return merged_df.sample(sample_size, random_state=seed)["PersonID"].tolist()
+
 
+def generate_sample(
+    sample_size: int, number_of_visits_lowerbound: int, seed: int = None
+) -> list[User]:
     # Get a list of 'User' objects from the sampled 'PersonID's with a progress bar
-    sample = [
+    return [
         User(person_id)
-        for person_id in tqdm(sample["PersonID"], desc="Generating sample (step 1/2)")
+        for person_id in tqdm(
+            sample_person_ids(sample_size, number_of_visits_lowerbound, seed),
+            desc="Generating sample",
+        )
     ]
 
-    return sample
 
+def parameter_grid(**values: list) -> list[dict]:
+    # All combinations of the given parameter values, e.g. boost=[1, 1.5], threshold=[0.2]
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
 
-def write_scores_truth_table(
+
+def evaluate_user(
+    user: User,
+    rec_systems: list,
+    methods: list[str],
+    test_split_size: float,
+    max_distance_km: float,
+    rng: random.Random,
+) -> dict:
+    """
+    Compare the recommendations for the train part of the user's visits with the test part,
+    for every method and every RecSystem.
+
+    Returns:
+    dict: (method, index of the RecSystem) -> [TP, FP, FN, compute time].
+    """
+    counts = {}
+    test_visits = user.split_previous_visits(test_split_size)
+    test_ids = [visit.museum.id3 for visit in test_visits]
+
+    # The context only depends on the user, so it is shared by all configurations
+    context = rec_systems[0].build_context(user)
+
+    for index, rec_system in enumerate(rec_systems):
+        for method in methods:
+            start = time.perf_counter()
+            if method == "perfect_matches":
+                # Get the recommendations based on the train set
+                recommendations = rec_system.perfect_matches(user, context)
+            elif method == "hidden_gems":
+                recommendations = rec_system.hidden_gems(user, context)
+            elif method == "local_spots":
+                recommendations = rec_system.local_spots(user, context)
+            elif method == "similar_museums":
+                recommendations = rec_system.similar_museums(user, context)
+            elif method == "random":
+                recommendations = rec_system.n_random_museums(5, rng)
+            else:
+                raise ValueError(f"Unknown recommender method '{method}'")
+            elapsed = time.perf_counter() - start
+
+            tp = fp = fn = 0
+            if method == "local_spots":
+                user_coord = get_city_coordinates(user.residence)
+                for recommendation in recommendations:
+                    rec_coord = get_city_coordinates(recommendation.city)
+                    if haversine(user_coord, rec_coord) <= max_distance_km:
+                        # Recommendation is within range
+                        tp += 1
+                    else:
+                        # Recommendation is out of range
+                        fn += 1
+            else:
+                recommended_ids = [recommendation.id3 for recommendation in recommendations]
+                for test_id in test_ids:
+                    if test_id in recommended_ids:
+                        tp += 1
+                    else:
+                        fn += 1
+                fp = sum(1 for museum_id in recommended_ids if museum_id not in test_ids)
+
+            counts[(method, index)] = [tp, fp, fn, elapsed]
+    return counts
+
+
+def _evaluate_shard(shard: tuple) -> dict:
+    person_ids, configs, methods, test_split_size, max_distance_km, seed = shard
+    rec_systems = [_rec_system.with_params(**config) for config in configs]
+
+    totals = {}
+    for person_id in person_ids:
+        # Seeded per member, so the results do not depend on how the sample is sharded
+        rng = random.Random(None if seed is None else f"{seed}-{person_id}")
+        counts = evaluate_user(
+            User(person_id), rec_systems, methods, test_split_size, max_distance_km, rng
+        )
+        for key, values in counts.items():
+            totals[key] = [a + b for a, b in zip(totals.get(key, [0, 0, 0, 0]), values)]
+    return totals
+
+
+def run_evaluation(
     sample_size: int,
     number_of_visits_lowerbound: int,
     test_split_size: float,
-    recommender_method: str = "local_spots",
+    methods: list[str] = ("local_spots", "random"),
+    configs: list[dict] = ({},),
     max_distance_km: float = 15.0,  # Maximum allowed distance for "local spots"
-):
+    processes: int = None,
+    seed: int = 42,
+    output: str = RESULTS_PATH,
+) -> list[dict]:
+    """
+    Evaluate several recommender methods and parameter configurations in one pass over a
+    sample of users, spread over a pool of processes.
+
+    Parameters:
+    configs (list): RecSystem parameters to evaluate, e.g. parameter_grid(boost=[1, 1.5]).
+    processes (int): Number of worker processes, defaults to the number of CPUs.
+    seed (int): Seed for the sample and the random recommender.
+    output (str): CSV file the result rows are appended to, or None.
+
+    Returns:
+    list: One result row (dict) per method and configuration.
+    """
+    global _rec_system
+
     # There must be at least 1 museum in the test set
-    if (number_of_visits_lowerbound * test_split_size < 1) and recommender_method != "local_spots":
+    if number_of_visits_lowerbound * test_split_size < 1 and set(methods) - {"local_spots"}:
         raise ValueError(
             "The test set must contain at least 1 museum. Please adjust the number_of_visits_lowerbound and test_split_size."
         )
 
-    sample = generate_sample(sample_size, number_of_visits_lowerbound)
-
-    r = RecSystem()
-
-    tp_count = 0
-    fn_count = 0
-
-    # Add a progress bar for processing each user in the sample
-    for user in tqdm(
-        sample, desc="Getting recommendations and comparing to test set (step 2/2)"
-    ):
-        test_visits = user.split_previous_visits(test_split_size)
-
-        if recommender_method == "perfect_matches":
-            # Get the recommendations based on the train set
-            recommendations = r.perfect_matches(user)
-        elif recommender_method == "random":
-            recommendations = r.n_random_museums(5)
-        elif recommender_method == "local_spots":
-            recommendations = r.local_spots(user)
-
-        if recommender_method == "perfect_matches" or recommender_method == "random":
-            # Calculate the TPs, FPs, FNs for perfect_matches
-            for visit in test_visits:
-                if visit[0].id3 in [
-                    recommendation.id3 for recommendation in recommendations
-                ]:
-                    tp_count += 1
-                else:
-                    fn_count += 1
-
-        elif recommender_method == "local_spots":
-            user_coord = get_city_coordinates(user.residence)
-            for recommendation in recommendations:
-                rec_coord = get_city_coordinates(recommendation.city)
-                if haversine(user_coord, rec_coord) <= max_distance_km:
-                    # Recommendation is within range
-                    tp_count += 1
-                else:
-                    # Recommendation is out of range
-                    fn_count += 1
-
-    recall = tp_count / (tp_count + fn_count)
+    start = time.perf_counter()
+    person_ids = sample_person_ids(sample_size, number_of_visits_lowerbound, seed)
+    if _rec_system is None:
+        _rec_system = RecSystem()
+
+    processes = processes or os.cpu_count() or 1
+    n_shards = min(len(person_ids), processes * 4) or 1
+    shards = [
+        (list(shard), list(configs), list(methods), test_split_size, max_distance_km, seed)
+        for shard in np.array_split(person_ids, n_shards)
+    ]
+
+    totals = {}
+
+    def add(results):
+        for shard_totals in tqdm(results, total=len(shards), desc="Evaluating"):
+            for key, values in shard_totals.items():
+                totals[key] = [a + b for a, b in zip(totals.get(key, [0, 0, 0, 0]), values)]
+
+    if processes == 1:
+        add(map(_evaluate_shard, shards))
+    else:
+        with ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            add(executor.map(_evaluate_shard, shards))
+    wall_time = time.perf_counter() - start
+
+    rows = []
+    for (method, index), (tp, fp, fn, compute_time) in sorted(totals.items()):
+        params = _rec_system.with_params(**configs[index])
+        rows.append(
+            {
+                "datetime": datetime.now(),
+                "recommender_method": method,
+                "boost": params.boost,
+                "threshold": params.threshold,
+                "quantile": params.quantile,
+                "n_recs": params.n_recs,
+                "sample_size": sample_size,
+                "number_of_visits_lowerbound": number_of_visits_lowerbound,
+                "test_split_size": test_split_size,
+                "seed": seed,
+                "TP": tp,
+                "FP": fp if method != "local_spots" else None,
+                "FN": fn,
+                "precision": tp / (tp + fp) if method != "local_spots" and tp + fp else None,
+                "recall": tp / (tp + fn) if tp + fn else None,
+                "compute_time": compute_time,
+                "wall_time": wall_time,
+                "users_per_second": len(person_ids) / compute_time if compute_time else None,
+            }
+        )
+
+    if output:
+        write_header = not os.path.exists(output)
+        with open(output, "a", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+        print(f"Scores written to '{output}'.")
+
+    return rows
+
+
+def write_scores_truth_table(
+    sample_size: int,
+    number_of_visits_lowerbound: int,
+    test_split_size: float,
+    recommender_method: str = "local_spots",
+    max_distance_km: float = 15.0,  # Maximum allowed distance for "local spots"
+):
+    row = run_evaluation(
+        sample_size,
+        number_of_visits_lowerbound,
+        test_split_size,
+        methods=[recommender_method],
+        max_distance_km=max_distance_km,
+        output=None,
+    )[0]
 
     # Write the scores to a CSV file
-    with open("data/scores_truth_table.csv", "a") as file:
+    with open(os.path.join(DATA_DIR, "scores_truth_table.csv"), "a") as file:
         file.write(
-            f"{datetime.now()},{recommender_method},{sample_size},{number_of_visits_lowerbound},{test_split_size},{tp_count},,{fn_count},,{recall},\n"
+            f"{datetime.now()},{recommender_method},{sample_size},{number_of_visits_lowerbound},{test_split_size},{row['TP']},,{row['FN']},,{row['recall']},\n"
         )
 
     print("Scores written to 'scores_truth_table.csv'.")
@@ -105,6 +307,39 @@ def write_scores_truth_table(
 # datetime,recommender_method,sample_size,number_of_visits_lowerbound,test_split_size,TP,FP,FN,precision,recall,remark
 
 
-write_scores_truth_table(2000, 6, 0.2, "local_spots")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate the recommenders on a sample of members."
+    )
+    parser.add_argument("--sample-size", type=int, default=2000)
+    parser.add_argument("--min-visits", type=int, default=6)
+    parser.add_argument("--test-split", type=float, default=0.2)
+    parser.add_argument(
+        "--methods", nargs="+", choices=METHODS, default=["local_spots", "random"]
+    )
+    parser.add_argument("--boost", type=float, nargs="+", default=[BOOST])
+    parser.add_argument("--threshold", type=float, nargs="+", default=[THRESHOLD])
+    parser.add_argument("--quantile", type=float, nargs="+", default=[QUANTILE])
+    parser.add_argument("--n-recs", type=int, nargs="+", default=[N_RECS])
+    parser.add_argument("--max-distance", type=float, default=15.0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
 
-write_scores_truth_table(2000, 6, 0.2, "random")
+    run_evaluation(
+        args.sample_size,
+        args.min_visits,
+        args.test_split,
+        methods=args.methods,
+        configs=parameter_grid(
+            boost=args.boost,
+            threshold=args.threshold,
+            quantile=args.quantile,
+            n_recs=args.n_recs,
+        ),
+        max_distance_km=args.max_distance,
+        processes=args.processes,
+        seed=args.seed,
+        output=args.output,
+    )
@@ -0,0 +1,152 @@
+"""
+Index of the museum events, built once from events.csv.
+"""
+
+from ast import literal_eval
+from collections import namedtuple
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+Topic = namedtuple("Topic", ["id", "title"])
+
+
+@dataclass
+class Event:
+    name: any
+    id: any
+    description: any
+    startDate: any
+    endDate: any
+    museumId: any
+
+
+def naive_timestamp(value) -> pd.Timestamp:
+    # Parse a date and drop its timezone, keeping the local time
+    timestamp = pd.to_datetime(value, errors="coerce")
+    if pd.isnull(timestamp):
+        return pd.NaT
+    return timestamp.replace(tzinfo=None)
+
+
+class EventIndex:
+    """
+    Events grouped by museumId, with their end dates parsed once.
+
+    The active events of a museum are cached until the first of them ends, since events can
+    only drop out of the active set as time moves on.
+    """
+
+    def __init__(self, events_df, topics_df, language: str = "nl"):
+        events_df = events_df[events_df["language"] == language]
+
+        # Many events share the same end date, so every distinct date is parsed only once
+        end_dates = {
+            value: naive_timestamp(value) for value in events_df["endDate"].dropna().unique()
+        }
+
+        self.events = {}
+        self.topic_ids = {}
+        for row in events_df.to_dict("records"):
+            event = Event(
+                name=row["name"],
+                id=row["id"],
+                description=row["description"],
+                startDate=row["startDate"],
+                endDate=end_dates.get(row["endDate"], pd.NaT),
+                museumId=row["museumId"],
+            )
+            self.events.setdefault(row["museumId"], []).append(event)
+
+            # topicIds are stored as a string representation of a list, e.g. "[1, 2, 3]"
+            topic_ids = row["topicIds"]
+            topic_ids = literal_eval(topic_ids) if isinstance(topic_ids, str) else []
+            self.topic_ids.setdefault(row["museumId"], []).extend(topic_ids)
+
+        self.topic_titles = dict(zip(topics_df["id"], topics_df["title"]))
+
+        # The events as arrays, for latest_active_starts(): the museum of every event as a
+        # code into museum_codes, and its start and end as nanoseconds (NaT is the smallest
+        # int64, so a missing date never is the latest one nor in the future)
+        start_dates = {
+            value: naive_timestamp(value) for value in events_df["startDate"].dropna().unique()
+        }
+        codes, museum_ids = pd.factorize(events_df["museumId"])
+        self.museum_codes = {museum_id: code for code, museum_id in enumerate(museum_ids)}
+        self._event_museums = codes
+        self._event_starts = pd.DatetimeIndex(
+            events_df["startDate"].map(start_dates).astype("datetime64[ns]")
+        ).asi8
+        self._event_ends = pd.DatetimeIndex(
+            events_df["endDate"].map(end_dates).astype("datetime64[ns]")
+        ).asi8
+        # (latest starts, computed at, valid until)
+        self._latest = None
+
+        # museumId -> (active events, computed at, valid until)
+        self._active = {}
+        # museumId -> [(Topic, count)]
+        self._topics = {}
+
+    def active_events(self, museum_id, now: pd.Timestamp = None) -> list[Event]:
+        """
+        Return the events of a museum that have not ended yet, in the order of events.csv.
+        """
+        if now is None:
+            now = pd.Timestamp.now()
+
+        cached = self._active.get(museum_id)
+        if cached is not None and cached[1] <= now < cached[2]:
+            return cached[0]
+
+        active = [
+            event for event in self.events.get(museum_id, []) if event.endDate > now
+        ]
+        valid_until = min((event.endDate for event in active), default=pd.Timestamp.max)
+        self._active[museum_id] = (active, now, valid_until)
+        return active
+
+    def codes(self, museum_ids) -> np.ndarray:
+        """
+        Return the code of every museumId for latest_active_starts(), or len(museum_codes)
+        for a museum without events.
+        """
+        missing = len(self.museum_codes)
+        return np.array(
+            [self.museum_codes.get(museum_id, missing) for museum_id in museum_ids],
+            dtype=np.int64,
+        )
+
+    def latest_active_starts(self, now: pd.Timestamp = None) -> np.ndarray:
+        """
+        Return the start of the latest active event of every museum (by code, see codes())
+        in nanoseconds, the smallest int64 (NaT) for the museums without active events.
+        """
+        if now is None:
+            now = pd.Timestamp.now()
+        if self._latest is not None and self._latest[1] <= now < self._latest[2]:
+            return self._latest[0]
+
+        active = self._event_ends > now.value
+        latest = np.full(len(self.museum_codes) + 1, np.iinfo(np.int64).min)
+        np.maximum.at(latest, self._event_museums[active], self._event_starts[active])
+
+        # The same set of events is active until the first of them ends
+        ends = self._event_ends[active]
+        valid_until = pd.Timestamp(ends.min()) if len(ends) else pd.Timestamp.max
+        self._latest = (latest, now, valid_until)
+        return latest
+
+    def topics(self, museum_id) -> list[tuple[Topic, int]]:
+        """
+        Return the topics of all events of a museum with the number of events per topic.
+        """
+        if museum_id not in self._topics:
+            # Count occurrences of each topic ID
+            topic_counts = pd.Series(self.topic_ids.get(museum_id, [])).value_counts()
+            self._topics[museum_id] = [
+                (Topic(id=topic_id, title=self.topic_titles[topic_id]), count)
+                for topic_id, count in topic_counts.to_dict().items()
+            ]
+        return self._topics[museum_id]
@@ -0,0 +1,180 @@
+"""
+Bulk export of the recommendations of all members, e.g. for a newsletter campaign.
+
+The members are split in chunks, which are spread over a pool of processes and computed
+with RecSystem.recommend_batch. Every chunk is written to its own part file in the output
+directory, so memory stays bounded by the chunk size:
+
+    python export.py --output data/export --format jsonl --chunk-size 2000
+
+The part files are written under a temporary name and renamed when complete, so after an
+interruption running the same command again only computes the missing chunks. The
+checkpoint file records the settings and the version of the data the parts belong to; the
+export starts over when these changed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+from data import get_context
+from recommenders import Recommendations, current_rec_system
+
+FORMATS = ["jsonl", "parquet"]
+CHUNK_SIZE = 2000
+CHECKPOINT_NAME = "checkpoint.json"
+
+# The RecSystem shared with the worker processes, created before they are forked
+_rec_system = None
+
+
+def part_name(chunk: int, format: str) -> str:
+    return f"part-{chunk:05d}.{format}"
+
+
+def to_records(results: list) -> list[dict]:
+    # One flat record per member: the museum names and ids of every section
+    records = []
+    for person_id, recommendations in results:
+        record = {"PersonID": str(person_id)}
+        for section in Recommendations._fields:
+            museums = getattr(recommendations, section)
+            record[section] = [museum.publicName for museum in museums]
+            record[f"{section}_ids"] = [
+                museum.id3 if isinstance(museum.id3, str) else None for museum in museums
+            ]
+        record["local_spots_km"] = [
+            round(museum.distance_from_user, 3) for museum in recommendations.local_spots
+        ]
+        records.append(record)
+    return records
+
+
+def write_part(records: list[dict], path: str, format: str):
+    # Write to a temporary file first, so a part file is always complete
+    temporary = f"{path}.tmp"
+    if format == "jsonl":
+        with open(temporary, "w") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+    else:
+        import pyarrow as pa
+        from pyarrow import parquet
+
+        parquet.write_table(pa.Table.from_pylist(records), temporary)
+    os.replace(temporary, path)
+
+
+def _export_chunk(job: tuple) -> int:
+    chunk, person_ids, output, format = job
+    results = _rec_system.recommend_batch(person_ids)
+    write_part(to_records(results), os.path.join(output, part_name(chunk, format)), format)
+    return len(person_ids)
+
+
+def read_checkpoint(output: str) -> dict:
+    try:
+        with open(os.path.join(output, CHECKPOINT_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def export_recommendations(
+    output: str,
+    format: str = "jsonl",
+    chunk_size: int = CHUNK_SIZE,
+    processes: int = None,
+    person_ids: list[str] = None,
+) -> dict:
+    """
+    Write the recommendations of the members to part files in the output directory.
+
+    Parameters:
+    format (str): "jsonl" or "parquet".
+    processes (int): Number of worker processes, defaults to the number of CPUs.
+    person_ids (list): The members to export, defaults to all members.
+
+    Returns:
+    dict: The number of members, chunks and chunks computed in this run.
+    """
+    global _rec_system
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format '{format}', expected one of {FORMATS}")
+
+    context = get_context()
+    if person_ids is None:
+        person_ids = context.user_store.member_ids
+    chunks = [
+        chunk.tolist()
+        for chunk in np.array_split(
+            np.asarray(person_ids, dtype=object), max(1, -(-len(person_ids) // chunk_size))
+        )
+    ]
+
+    os.makedirs(output, exist_ok=True)
+    checkpoint = {
+        "data_version": context.version,
+        "members": len(person_ids),
+        "chunks": len(chunks),
+        "format": format,
+    }
+    if read_checkpoint(output) != checkpoint:
+        # Parts of another export would be mixed with the new ones
+        for name in os.listdir(output):
+            if name.startswith("part-"):
+                os.remove(os.path.join(output, name))
+        with open(os.path.join(output, CHECKPOINT_NAME), "w") as file:
+            json.dump(checkpoint, file)
+
+    jobs = [
+        (index, chunk, output, format)
+        for index, chunk in enumerate(chunks)
+        if not os.path.exists(os.path.join(output, part_name(index, format)))
+    ]
+    if _rec_system is None or _rec_system.context is not context:
+        _rec_system = current_rec_system()
+
+    start = time.perf_counter()
+    processes = processes or os.cpu_count() or 1
+    progress = tqdm(total=sum(len(job[1]) for job in jobs), desc="Exporting", unit="members")
+    if processes == 1 or len(jobs) <= 1:
+        for job in jobs:
+            progress.update(_export_chunk(job))
+    else:
+        with ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            for count in executor.map(_export_chunk, jobs):
+                progress.update(count)
+    progress.close()
+
+    return {
+        "members": len(person_ids),
+        "chunks": len(chunks),
+        "computed_chunks": len(jobs),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the recommendations of all members.")
+    parser.add_argument("--output", default=os.path.join("data", "export"))
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    summary = export_recommendations(
+        args.output, args.format, args.chunk_size, args.processes
+    )
+    print(
+        f"Recommendations of {summary['members']} members written to '{args.output}' "
+        f"({summary['computed_chunks']} of {summary['chunks']} chunks computed now)."
+    )
@@ -0,0 +1,132 @@
+"""
+Geographic helpers: city coordinates, (vectorized) haversine distances and a nearest
+neighbour index over points on the Earth.
+"""
+
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+
+RADIUS_EARTH_KM = 6371  # Radius of Earth in kilometers
+
+
+# Function to calculate distance using the Haversine formula
+def haversine(coord1, coord2):
+    """
+    Calculate the great-circle distance between two points on the Earth.
+
+    :param coord1: Tuple (latitude, longitude) for the first point.
+    :param coord2: Tuple (latitude, longitude) for the second point.
+    :return: Distance in kilometers.
+    """
+    # Convert latitude and longitude from degrees to radians
+    lat1, lon1 = radians(coord1[0]), radians(coord1[1])
+    lat2, lon2 = radians(coord2[0]), radians(coord2[1])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return RADIUS_EARTH_KM * c
+
+
+def haversine_many(coord, lats, lons) -> np.ndarray:
+    """
+    Calculate the great-circle distances between one point and an array of points.
+
+    :param coord: Tuple (latitude, longitude) of the point.
+    :param lats: Array of latitudes.
+    :param lons: Array of longitudes.
+    :return: Array of distances in kilometers.
+    """
+    lat1, lon1 = np.radians(coord[0]), np.radians(coord[1])
+    lat2, lon2 = np.radians(np.asarray(lats, dtype=float)), np.radians(
+        np.asarray(lons, dtype=float)
+    )
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return RADIUS_EARTH_KM * c
+
+
+def normalise_city_name(city_name) -> str:
+    if isinstance(city_name, float):
+        city_name = str(city_name)
+    return city_name.upper().replace("/", "").replace("'", "").replace("-", " ")
+
+
+class CityCoordinates:
+    def __init__(self, cities_df):
+        # The first entry of a city wins, like the lookup in cities_df did
+        cities_df = cities_df.drop_duplicates(subset=["city"])
+        self.coordinates = dict(
+            zip(cities_df["city"], zip(cities_df["lat"], cities_df["lon"]))
+        )
+
+    def get(self, city_name) -> tuple:
+        # Returns (0, 0) for unknown cities
+        return self.coordinates.get(normalise_city_name(city_name), (0, 0))
+
+
+def unit_vectors(lats, lons) -> np.ndarray:
+    # Points on the unit sphere, where the straight-line (chord) distance grows with the
+    # great-circle distance, so a KD-tree over them finds the nearest points on the Earth
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack(
+        (np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats))
+    )
+
+
+class GeoIndex:
+    """
+    Nearest neighbour index over named points, e.g. the cities with a museum.
+    """
+
+    def __init__(self, names: list, lats, lons):
+        self.names = list(names)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        # Imported here, scipy.spatial takes a while to import
+        from scipy.spatial import cKDTree
+
+        self.tree = cKDTree(unit_vectors(self.lats, self.lons))
+
+    def __len__(self):
+        return len(self.names)
+
+    def distances(self, coord) -> np.ndarray:
+        # Distances in kilometers from coord to all points
+        return haversine_many(coord, self.lats, self.lons)
+
+    def _with_distances(self, coord, positions) -> list[tuple]:
+        distances = haversine_many(coord, self.lats[positions], self.lons[positions])
+        order = np.argsort(distances, kind="stable")
+        return [(self.names[positions[i]], float(distances[i])) for i in order]
+
+    def nearest(self, coord, k: int) -> list[tuple]:
+        """
+        Return the k points closest to coord as (name, distance in km), closest first.
+        """
+        k = min(k, len(self.names))
+        if k <= 0:
+            return []
+        _, positions = self.tree.query(unit_vectors([coord[0]], [coord[1]])[0], k=k)
+        return self._with_distances(coord, np.atleast_1d(positions))
+
+    def within(self, coord, radius_km: float) -> list[tuple]:
+        """
+        Return the points at most radius_km from coord as (name, distance in km), closest first.
+        """
+        chord = 2 * np.sin(min(radius_km / RADIUS_EARTH_KM, np.pi) / 2)
+        positions = self.tree.query_ball_point(
+            unit_vectors([coord[0]], [coord[1]])[0], chord
+        )
+        return [
+            (name, distance)
+            for name, distance in self._with_distances(coord, np.asarray(positions, dtype=int))
+            if distance <= radius_km
+        ]
@@ -0,0 +1,218 @@
+"""
+Offline resizing of the museum images.
+
+The originals in static/museum_images are large, while the cards show them at 300px. The
+images are resized once to a few fixed widths, in WebP and JPEG:
+
+    python images.py --processes 4    (or: flask build-images)
+
+The derivatives get content-hashed file names, so they can be cached by the browser forever.
+A manifest records the size, mtime and hash of every original, so a rebuild only resizes
+new or changed images.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+SOURCE_DIR = "static/museum_images"
+DERIVATIVE_DIR = "static/derivatives"
+MANIFEST_NAME = "manifest.json"
+# Bump this when the resizing or encoding below changes, so that all images are rebuilt
+DERIVATIVE_VERSION = 1
+WIDTHS = [300, 600]  # 1x and 2x of the width of a card
+# Format -> (Pillow format, file extension, save options)
+FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 6}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+# The names derivative_name gives, the only files the cleanup of build_derivatives removes
+DERIVATIVE_PATTERN = re.compile(
+    r".+-\d+\.[0-9a-f]{12}\.(%s)" % "|".join(extension for _, extension, _ in FORMATS.values())
+)
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def derivative_name(uuid: str, width: int, source_hash: str, extension: str) -> str:
+    # The hash changes with the original and the settings, so a name is never reused
+    digest = hashlib.sha1(
+        f"{source_hash}:{width}:{extension}:{DERIVATIVE_VERSION}".encode()
+    ).hexdigest()[:12]
+    return f"{uuid}-{width}.{digest}.{extension}"
+
+
+def resize_image(source: str, output_dir: str, source_hash: str, widths=WIDTHS) -> dict:
+    """
+    Write the derivatives of one image.
+
+    Returns:
+    dict: Format -> {width: file name} of the written derivatives.
+    """
+    from PIL import Image
+
+    uuid = os.path.splitext(os.path.basename(source))[0]
+    files = {name: {} for name in FORMATS}
+    with Image.open(source) as original:
+        original = original.convert("RGB")
+        # Images are never upscaled; widths above the original width collapse into one
+        for width in sorted({min(width, original.width) for width in widths}):
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for name, (pil_format, extension, options) in FORMATS.items():
+                filename = derivative_name(uuid, width, source_hash, extension)
+                resized.save(os.path.join(output_dir, filename), pil_format, **options)
+                files[name][str(width)] = filename
+    return files
+
+
+def _resize_job(job: tuple) -> tuple:
+    uuid, source, output_dir, source_hash, widths = job
+    try:
+        return uuid, resize_image(source, output_dir, source_hash, widths)
+    except OSError as e:
+        # Unreadable images are skipped, so the cards keep showing the original
+        print(f"Could not resize '{source}': {e}", file=sys.stderr)
+        return uuid, None
+
+
+def read_manifest(output_dir: str = DERIVATIVE_DIR) -> dict:
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+        if manifest.get("version") == DERIVATIVE_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": DERIVATIVE_VERSION, "widths": [], "images": {}}
+
+
+def build_derivatives(
+    source_dir: str = SOURCE_DIR,
+    output_dir: str = DERIVATIVE_DIR,
+    widths: list[int] = WIDTHS,
+    processes: int = None,
+) -> dict:
+    """
+    Resize the new and changed images in source_dir, in parallel, and update the manifest.
+
+    Returns:
+    dict: The manifest.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = read_manifest(output_dir)
+    if manifest["widths"] != list(widths):
+        # Other widths, so none of the derivatives can be reused
+        manifest["images"] = {}
+    previous = manifest["images"]
+
+    images = {}
+    jobs = []
+    for entry in sorted(os.scandir(source_dir), key=lambda entry: entry.name):
+        if not entry.is_file() or not entry.name.endswith(".jpg"):
+            continue
+        uuid = entry.name[: -len(".jpg")]
+        stat = entry.stat()
+        image = previous.get(uuid)
+        if image and image["size"] == stat.st_size and image["mtime_ns"] == stat.st_mtime_ns:
+            images[uuid] = image
+            continue
+
+        # Touched files keep their derivatives when the content did not change
+        source_hash = file_hash(entry.path)
+        if image and image["hash"] == source_hash:
+            images[uuid] = dict(image, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
+
+        images[uuid] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": source_hash}
+        jobs.append((uuid, entry.path, output_dir, source_hash, list(widths)))
+
+    if jobs:
+        print(f"Resizing {len(jobs)} images", file=sys.stderr)
+
+        def add(results):
+            for uuid, files in results:
+                if files is None:
+                    del images[uuid]
+                else:
+                    images[uuid]["files"] = files
+
+        if processes == 1:
+            add(map(_resize_job, jobs))
+        else:
+            with ProcessPoolExecutor(processes) as executor:
+                add(executor.map(_resize_job, jobs, chunksize=8))
+
+    # Remove the derivatives of changed and deleted images. Other files are left alone, in
+    # case output_dir is shared.
+    current = {
+        filename
+        for image in images.values()
+        for sizes in image["files"].values()
+        for filename in sizes.values()
+    }
+    for entry in os.scandir(output_dir):
+        if DERIVATIVE_PATTERN.fullmatch(entry.name) and entry.name not in current:
+            os.remove(entry.path)
+
+    manifest = {"version": DERIVATIVE_VERSION, "widths": list(widths), "images": images}
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+class DerivativeIndex:
+    """
+    The derivatives of the museum images, for building srcset attributes in the templates.
+    """
+
+    def __init__(self, manifest: dict, url_prefix: str = "/images"):
+        self.images = manifest["images"]
+        self.url_prefix = url_prefix
+
+    @classmethod
+    def load(cls, output_dir: str = DERIVATIVE_DIR, **kwargs) -> "DerivativeIndex":
+        return cls(read_manifest(output_dir), **kwargs)
+
+    def _files(self, image_url: str, image_format: str) -> dict:
+        # image_url is an original, e.g. /static/museum_images/{uuid}.jpg
+        uuid = os.path.splitext(os.path.basename(image_url or ""))[0]
+        image = self.images.get(uuid)
+        return image["files"][image_format] if image else {}
+
+    def srcset(self, image_url: str, image_format: str = "jpeg") -> str:
+        # E.g. "/images/{uuid}-300.{hash}.jpg 300w, ...", or "" without derivatives
+        return ", ".join(
+            f"{self.url_prefix}/{filename} {width}w"
+            for width, filename in sorted(
+                self._files(image_url, image_format).items(), key=lambda item: int(item[0])
+            )
+        )
+
+    def src(self, image_url: str) -> str:
+        # The smallest JPEG derivative, or the original when there is none
+        files = self._files(image_url, "jpeg")
+        if not files:
+            return image_url
+        return f"{self.url_prefix}/{files[min(files, key=int)]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resize the museum images.")
+    parser.add_argument("--source", default=SOURCE_DIR)
+    parser.add_argument("--output", default=DERIVATIVE_DIR)
+    parser.add_argument("--widths", type=int, nargs="+", default=WIDTHS)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    manifest = build_derivatives(args.source, args.output, args.widths, args.processes)
+    print(f"Derivatives of {len(manifest['images'])} images written to '{args.output}'.")
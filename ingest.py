@@ -0,0 +1,74 @@
+"""
+Ingestion of new visits while the app is running.
+
+A delta with the columns of visits.csv, as CSV or as JSON lines, is posted to /visits:
+
+    curl -X POST -H "Authorization: Bearer $INGEST_TOKEN" --data-binary @delta.jsonl \
+        http://localhost:5000/visits
+
+The visits are added to the user store and the cached recommendations of the members
+whose visits changed are dropped, so their next request uses the new visits. Nothing is
+written to disk: append the delta to data/visits.csv as well, so it survives a restart.
+"""
+
+import csv
+import io
+import json
+
+import pandas as pd
+
+from cache import RecommendationCache
+from userstore import UserStore
+
+VISIT_COLUMNS = ["PersonID", "BezoekDatum", "MuseumCode", "MuseumNaam"]
+
+
+def parse_jsonl(text: str) -> list[dict]:
+    records = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number} is not valid JSON: {e}") from None
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_number} is not a JSON object")
+        records.append(record)
+    return records
+
+
+def parse_csv(text: str) -> list[dict]:
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def to_visits(records: list[dict]) -> list[tuple]:
+    """
+    Convert visit records to (PersonID, museum name, timestamp) tuples. Records without a
+    museum name are skipped, like when the user store is built.
+    """
+    visits = []
+    for number, record in enumerate(records, start=1):
+        missing = [column for column in ("PersonID", "BezoekDatum") if not record.get(column)]
+        if missing:
+            raise ValueError(f"Record {number} has no {', '.join(missing)}")
+        if not record.get("MuseumNaam"):
+            continue
+        try:
+            timestamp = pd.to_datetime(str(record["BezoekDatum"]), format="%Y%m%d")
+        except ValueError:
+            raise ValueError(
+                f"Record {number} has an invalid BezoekDatum: {record['BezoekDatum']!r}"
+            ) from None
+        visits.append((str(record["PersonID"]), record["MuseumNaam"], timestamp))
+    return visits
+
+
+def ingest_visits(
+    records: list[dict], store: UserStore, cache: RecommendationCache
+) -> dict:
+    visits = to_visits(records)
+    changed = store.add_visits(visits)
+    for person_id in changed:
+        cache.invalidate(person_id)
+    return {"visits": len(visits), "members": len(changed)}
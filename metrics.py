@@ -0,0 +1,159 @@
+"""
+Timings of the stages of a recommendation request.
+
+Functions and methods wrapped with timed() (or a block in `with stage(...)`) record their
+duration in a histogram per stage, which /metrics exposes in the Prometheus text format.
+Stages can be nested; within a profile() the total time of every stack of stages is kept as
+well, which gives a per-request breakdown in the collapsed stack format of flame graphs.
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds in seconds; property accesses take microseconds, a request up to seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The stages the current code runs in, and the profile of the current request if any. Both
+# are context variables, so they follow a request into the threads of the serving pool
+# when the task is submitted with contextvars.copy_context().run.
+_stack = contextvars.ContextVar("metrics_stack", default=())
+_profile = contextvars.ContextVar("metrics_profile", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+
+class Profile:
+    def __init__(self):
+        self.totals = defaultdict(float)  # stack of stages -> total seconds
+        self._lock = threading.Lock()
+
+    def add(self, stack: tuple, seconds: float):
+        with self._lock:
+            self.totals[stack] += seconds
+
+    def collapsed(self) -> str:
+        """
+        Return one "stage;stage;stage microseconds" line per stack, with the time spent in the
+        stack itself and not in its children, as read by flamegraph.pl and speedscope.
+        """
+        with self._lock:
+            self_times = dict(self.totals)
+            for stack, seconds in self.totals.items():
+                if len(stack) > 1 and stack[:-1] in self_times:
+                    self_times[stack[:-1]] -= seconds
+        return "".join(
+            f"{';'.join(stack)} {max(0, round(seconds * 1e6))}\n"
+            for stack, seconds in sorted(self_times.items())
+        )
+
+
+histograms = defaultdict(Histogram)
+_histograms_lock = threading.Lock()
+
+
+def observe(name: str, seconds: float):
+    histogram = histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = histograms[name]
+    histogram.observe(seconds)
+
+
+@contextmanager
+def stage(name: str):
+    stack = _stack.get() + (name,)
+    token = _stack.set(stack)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stack.reset(token)
+        observe(name, elapsed)
+        profile = _profile.get()
+        if profile is not None:
+            profile.add(stack, elapsed)
+
+
+@contextmanager
+def profile():
+    # Collect the stages run within the block, e.g. for ?profile=1
+    current = Profile()
+    token = _profile.set(current)
+    try:
+        yield current
+    finally:
+        _profile.reset(token)
+
+
+def timed(name: str):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        wrapper.instrumented = True
+        return wrapper
+
+    return decorator
+
+
+def instrument(cls, names: list[str]):
+    """
+    Replace the given methods and properties of a class by timed versions, recorded as the
+    stage "ClassName.name".
+    """
+    for name in names:
+        attribute = cls.__dict__[name]
+        stage_name = f"{cls.__name__}.{name}"
+        if isinstance(attribute, property):
+            if not getattr(attribute.fget, "instrumented", False):
+                setattr(cls, name, property(timed(stage_name)(attribute.fget)))
+        elif not getattr(attribute, "instrumented", False):
+            setattr(cls, name, timed(stage_name)(attribute))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    # The histograms in the Prometheus text exposition format
+    lines = [
+        "# HELP recommender_stage_seconds Time spent in a stage of a recommendation request.",
+        "# TYPE recommender_stage_seconds histogram",
+    ]
+    with _histograms_lock:
+        items = sorted(histograms.items())
+    for name, histogram in items:
+        label = f'stage="{_escape(name)}"'
+        with histogram._lock:
+            counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            lines.append(
+                f'recommender_stage_seconds_bucket{{{label},le="{bound}"}} {cumulative}'
+            )
+        lines.append(f"recommender_stage_seconds_sum{{{label}}} {total}")
+        lines.append(f"recommender_stage_seconds_count{{{label}}} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,177 @@
+"""
+Offline extraction of the nouns in the museum descriptions.
+
+Parsing a description with spaCy is by far the most expensive step of a recommendation,
+so the nouns of every museum are extracted once and stored in a versioned index on disk:
+
+    python nouns.py --n-process 4
+
+At runtime the index is a plain dictionary lookup. spaCy is only loaded when the index is
+missing or when some of its entries are stale (the description, the model or its version
+changed).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from importlib import metadata
+
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+NOUN_INDEX_PATH = os.path.join(DATA_DIR, "description_nouns.json")
+# Bump this when the noun filter below changes, so that old indexes are rebuilt.
+NOUN_INDEX_VERSION = 1
+SPACY_MODEL = "nl_core_news_sm"
+EXCLUDED_NOUNS = ["museum", "musea", "Museum", "Musea", "#", "‘"]
+
+_nlp = None
+
+
+def get_nlp():
+    # Load the Dutch language model only when we actually need to parse something
+    global _nlp
+    if _nlp is None:
+        import spacy
+
+        _nlp = spacy.load(SPACY_MODEL)
+    return _nlp
+
+
+def model_version() -> str:
+    # The version of the model, from the package metadata while it is not loaded, so that
+    # checking the index does not load spaCy. None when the model is not installed.
+    if _nlp is not None:
+        return _nlp.meta["version"]
+    try:
+        return metadata.version(SPACY_MODEL)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def clean_description(description) -> str:
+    # Missing descriptions are read as NaN (float) by pandas
+    if isinstance(description, float):
+        return str(description)
+    return description
+
+
+def description_hash(description) -> str:
+    return hashlib.sha1(clean_description(description).encode("utf-8")).hexdigest()
+
+
+def nouns_from_doc(doc) -> list[str]:
+    return [
+        token.text
+        for token in doc
+        if (
+            len(token.text) >= 3
+            and token.pos_ == "NOUN"
+            and token.text not in EXCLUDED_NOUNS
+        )
+        or token.text.isnumeric()
+        and len(token.text) in [2, 4]
+    ]
+
+
+def extract_nouns(description) -> list[str]:
+    return nouns_from_doc(get_nlp()(clean_description(description)))
+
+
+def build_noun_index(
+    descriptions: dict, n_process: int = 1, batch_size: int = 64
+) -> dict:
+    """
+    Extract the nouns of the given descriptions with spaCy.
+
+    Parameters:
+    descriptions (dict): Mapping of museum publicName to its description.
+    n_process (int): Number of processes used by nlp.pipe.
+    batch_size (int): Number of descriptions per batch.
+
+    Returns:
+    dict: Mapping of publicName to {"hash": <description hash>, "nouns": [...]}.
+    """
+    names = list(descriptions)
+    texts = [clean_description(descriptions[name]) for name in names]
+    docs = get_nlp().pipe(texts, n_process=n_process, batch_size=batch_size)
+
+    return {
+        name: {"hash": description_hash(text), "nouns": nouns_from_doc(doc)}
+        for name, text, doc in zip(names, texts, docs)
+    }
+
+
+def read_noun_index(path: str = NOUN_INDEX_PATH) -> dict:
+    # Returns the entries of the index, or an empty dict when it is missing or outdated
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        index = json.load(file)
+    if index.get("version") != NOUN_INDEX_VERSION or index.get("model") != SPACY_MODEL:
+        return {}
+    # Without the model installed the index cannot be rebuilt anyway, so it is kept
+    version = model_version()
+    if version is not None and index.get("model_version") != version:
+        return {}
+    return index["museums"]
+
+
+def write_noun_index(entries: dict, path: str = NOUN_INDEX_PATH):
+    index = {
+        "version": NOUN_INDEX_VERSION,
+        "model": SPACY_MODEL,
+        "model_version": model_version(),
+        "museums": entries,
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(index, file, ensure_ascii=False)
+
+
+def load_noun_index(descriptions: dict, path: str = NOUN_INDEX_PATH) -> dict:
+    """
+    Load the noun index for the given descriptions, re-parsing only the missing or stale entries.
+
+    Returns:
+    dict: Mapping of publicName to the list of nouns in its description.
+    """
+    entries = read_noun_index(path)
+    stale = {
+        name: description
+        for name, description in descriptions.items()
+        if name not in entries or entries[name]["hash"] != description_hash(description)
+    }
+
+    # Museums that are no longer in the descriptions are dropped from the index
+    removed = set(entries) - set(descriptions)
+
+    if stale or removed:
+        if stale:
+            print(f"Extracting nouns for {len(stale)} museum descriptions", file=sys.stderr)
+            entries.update(build_noun_index(stale))
+        entries = {name: entries[name] for name in descriptions}
+        try:
+            write_noun_index(entries, path)
+        except OSError as e:
+            print(f"Could not write the noun index: {e}", file=sys.stderr)
+
+    return {name: entries[name]["nouns"] for name in descriptions}
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Build the museum description noun index.")
+    parser.add_argument("--museums", default=os.path.join(DATA_DIR, "museums.csv"))
+    parser.add_argument("--output", default=NOUN_INDEX_PATH)
+    parser.add_argument("--n-process", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    museums = pd.read_csv(args.museums)
+    museums = museums[museums["language"] == "nl"]
+    descriptions = dict(zip(museums["publicName"], museums["description"]))
+
+    entries = build_noun_index(descriptions, args.n_process, args.batch_size)
+    write_noun_index(entries, args.output)
+    print(f"Noun index with {len(entries)} museums written to '{args.output}'.")
@@ -1,267 +1,472 @@
+import copy
 import random
-from data import *
-from math import radians, sin, cos, sqrt, atan2
+import threading
+from collections import namedtuple
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from data import DataContext, Museum, User, get_context
+
+from embeddings import build_index, normalise
+from geo import GeoIndex, haversine, haversine_many
+from scoring import InvertedNounIndex
+from snapshot import OLD_MUSEUMS
 
 BOOST = 1.5
 N_RECS = 6
 THRESHOLD = 0.2
 QUANTILE = 0.90
-OLD_MUSEUMS = [
-    "Wereld van Wenters"
-]  # These are not longer available, but are still sometimes in the dataset.
-
-cities_df = pd.read_csv("data/cities_grouped.csv")
-
-museums_short = pd.read_csv("data/museum_nouns_and_visits.csv")
-popularity_threshold = museums_short["n_visits"].quantile(QUANTILE)
-bottom_threshold = museums_short["n_visits"].quantile(0.25)
-
-museums_dict = museums_short.set_index("publicName").to_dict("index")
-for museum in museums_dict:
-    museums_dict[museum]["Nouns"] = eval(museums_dict[museum]["Nouns"])
-
-
-# Function to calculate distance using the Haversine formula
-def haversine(coord1, coord2):
-    """
-    Calculate the great-circle distance between two points on the Earth.
-
-    :param coord1: Tuple (latitude, longitude) for the first point.
-    :param coord2: Tuple (latitude, longitude) for the second point.
-    :return: Distance in kilometers.
-    """
-    # Convert latitude and longitude from degrees to radians
-    lat1, lon1 = radians(coord1[0]), radians(coord1[1])
-    lat2, lon2 = radians(coord2[0]), radians(coord2[1])
-
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    radius_earth_km = 6371  # Radius of Earth in kilometers
-    return radius_earth_km * c
 
 
 # Function to get coordinates of a city
 def get_city_coordinates(city_name):
-    if isinstance(city_name, float):
-        city_name = str(city_name)
-    city_name = city_name.upper().replace("/", "").replace("'", "").replace("-", " ")
-    # Find the entries in cities_df that match the city_name
-    city = cities_df[cities_df.city == city_name]
-    if city.empty:
-        return (0, 0)
-    return city.iloc[0].lat, city.iloc[0].lon
+    return get_context().city_coordinates.get(city_name)
 
 
-class RecSystem:
-    def __init__(self):
-        all_museums = pd.read_csv("data/museums.csv")
-        all_museums = all_museums[all_museums.language == "nl"]
-        all_museums = all_museums.dropna(subset=["city"])
+Recommendations = namedtuple(
+    "Recommendations", ["perfect_matches", "hidden_gems", "local_spots", "also_visited"]
+)
 
-        self.all_users = pd.read_csv("data/members.csv")
 
-        all_museums["city"] = all_museums["city"].str.upper()
+@dataclass
+class RequestContext:
+    # Everything about a user that is shared by the recommenders within one request
+    user_coords: tuple
+    closest_cities: list  # The ten closest cities with a museum, closest first
+    now: pd.Timestamp  # Events are active when they end after this moment
+    prev_visits: list  # Names of the previously visited museums
+    relevant_ids: np.ndarray  # Ids of the museums worth recommending, see get_relevant_ids
+    relevant: np.ndarray  # Mask of the relevant museums over the rows of the noun matrix
+    user_nouns: list
 
-        all_museums = [Museum(*row) for row in all_museums.itertuples(index=False)]
-        self.all_museums = [
-            m
-            for m in all_museums
-            if m.published == True and m.publicName not in OLD_MUSEUMS
-        ]
 
-    def distance_to_all_museums(self, user_coords: str):
-        city_distances = []
+class RecSystem:
+    def __init__(
+        self,
+        boost: float = BOOST,
+        threshold: float = THRESHOLD,
+        quantile: float = QUANTILE,
+        n_recs: int = N_RECS,
+        context: DataContext = None,
+    ):
+        self.boost = boost
+        self.threshold = threshold
+        self.quantile = quantile
+        self.n_recs = n_recs
+        # The version of the data this RecSystem and its indexes are built from
+        self.context = context or get_context()
+        self.catalogue = catalogue = self.context.catalogue
+        self.museums_dict = self.context.museums_dict
+        self.popularity = catalogue.popularity
+
+        # Only the published museums with a known city are recommended
+        self.museum_ids = [
+            museum_id
+            for museum_id, (name, city, published) in enumerate(
+                zip(
+                    catalogue.columns["publicName"],
+                    catalogue.columns["city"],
+                    catalogue.columns["published"],
+                )
+            )
+            if published == True and pd.notna(city) and name not in OLD_MUSEUMS
+        ]
+        self.all_museums = [catalogue.museum(museum_id) for museum_id in self.museum_ids]
 
+        self.ids_by_name = {}
+        for museum in self.all_museums:
+            self.ids_by_name.setdefault(museum.publicName, []).append(museum.id)
+
+        self.noun_matrix = InvertedNounIndex(
+            {name: museum["Nouns"] for name, museum in self.museums_dict.items()}
+        )
+
+        # Per museum id of the catalogue, for get_relevant_ids: the code of its events in
+        # the event index, the code of its name, and its row in the noun matrix (or
+        # len(noun_matrix) when it has none)
+        names = catalogue.columns["publicName"]
+        self.event_codes = self.context.event_index.codes(catalogue.columns["id3"])
+        self.name_codes, _ = pd.factorize(pd.Series(names, dtype=object), use_na_sentinel=False)
+        self.noun_rows = np.array(
+            [self.noun_matrix.row_of.get(name, len(self.noun_matrix)) for name in names],
+            dtype=np.int64,
+        )
+        self.recommended_ids = np.array(self.museum_ids, dtype=np.int64)
+        self.all_name_codes = self.name_codes[self.recommended_ids]
+        self.museum_at = np.full(len(catalogue), None, dtype=object)
+        self.museum_at[self.museum_ids] = self.all_museums
+
+        # Nearest neighbour index over the cities with a museum
+        cities = sorted(set(museum.city for museum in self.all_museums))
+        city_coordinates = self.context.city_coordinates
+        cities = [city for city in cities if city_coordinates.get(city) != (0, 0)]
+        coordinates = [city_coordinates.get(city) for city in cities]
+        self.city_index = GeoIndex(
+            cities, [lat for lat, _ in coordinates], [lon for _, lon in coordinates]
+        )
+        # The city of every museum id as its position in the index, or len(city_index)
+        self.city_positions = {city: position for position, city in enumerate(cities)}
+        self.city_codes = np.array(
+            [self.city_positions.get(city, len(cities)) for city in catalogue.columns["city"]],
+            dtype=np.int64,
+        )
+
+    @property
+    def all_users(self) -> pd.DataFrame:
+        # Read on first use, the recommenders themselves only need the user store
+        return self.context.members_df
+
+    def with_params(self, **params) -> "RecSystem":
+        """
+        Return a copy of this RecSystem with other parameters (boost, threshold, quantile
+        and/or n_recs), sharing all data and indexes.
+        """
+        rec_system = copy.copy(self)
+        for name, value in params.items():
+            if name not in ("boost", "threshold", "quantile", "n_recs"):
+                raise TypeError(f"Unknown parameter '{name}'")
+            setattr(rec_system, name, value)
+        return rec_system
+
+    @property
+    def popularity_threshold(self) -> float:
+        # Local spots have fewer visits than this
+        return self.popularity.threshold(self.quantile)
+
+    def in_cities(self, cities: list[str]) -> np.ndarray:
+        # Mask over the museum ids of the museums in the given cities of the city index
+        selected = np.zeros(len(self.city_index) + 1, dtype=bool)
+        selected[[self.city_positions[city] for city in cities]] = True
+        selected[-1] = False
+        return selected[self.city_codes]
+
+    def distance_to_all_museums(self, user_coords: tuple) -> list[tuple[str, float]]:
         # Calculate distances to all cities
-        for city in set(museum.city for museum in self.all_museums):
-            city_coords = get_city_coordinates(city)
-            if city_coords == (0, 0):
-                continue
-            distance = haversine(user_coords, city_coords)
-            city_distances.append((city, distance))
+        distances = self.city_index.distances(user_coords)
+        return list(zip(self.city_index.names, distances.tolist()))
 
-        return city_distances
+    def closest_cities(self, user_coords: tuple, n: int) -> list[str]:
+        return [city for city, distance in self.city_index.nearest(user_coords, n)]
 
-    def n_random_museums(self, n: int) -> list[Museum]:
-        return random.sample(self.all_museums, n)
+    def n_random_museums(self, n: int, rng: random.Random = random) -> list[Museum]:
+        return rng.sample(self.all_museums, n)
     
-    def get_relevant_museums(self, user: User) -> list[Museum]:
-        relevant_museums = []
-        for museum, time in user.previous_visits:
-            if not len(museum.events) == 0:
-                for event in museum.events:
-                    if pd.to_datetime(event.startDate).replace(
-                        tzinfo=None
-                    ) > pd.to_datetime(time).replace(tzinfo=None):
-                        relevant_museums.append(museum)
-                        break
-        prev_visits = [m[0].publicName for m in user.previous_visits]
+    def get_relevant_ids(self, user: User, now: pd.Timestamp = None) -> np.ndarray:
+        """
+        Return the ids of the museums worth recommending to a user: the visited museums with
+        an active event that started after the visit, followed by all museums the user has
+        not visited.
+        """
+        visited_ids = np.array(
+            [museum.id for museum, _ in user.previous_visits], dtype=np.int64
+        )
+        visit_times = np.array(
+            [pd.Timestamp(time).value for _, time in user.previous_visits], dtype=np.int64
+        )
+        latest_starts = self.context.event_index.latest_active_starts(now)
+        revisit_ids = visited_ids[latest_starts[self.event_codes[visited_ids]] > visit_times]
+
+        visited_names = np.zeros(self.name_codes.max(initial=0) + 1, dtype=bool)
+        visited_names[self.name_codes[visited_ids]] = True
+        not_visited_ids = self.recommended_ids[~visited_names[self.all_name_codes]]
+        return np.concatenate([revisit_ids, not_visited_ids])
+
+    def get_relevant_museums(self, user: User, now: pd.Timestamp = None) -> list[Museum]:
+        return self.museums(self.get_relevant_ids(user, now))
+
+    def museums(self, museum_ids: np.ndarray) -> list[Museum]:
+        # The shared museums of all_museums, or new ones for the museums not recommended
+        return [
+            museum if museum is not None else self.catalogue.museum(museum_id)
+            for museum_id, museum in zip(museum_ids.tolist(), self.museum_at[museum_ids])
+        ]
 
-        for museum in self.all_museums:
-            if museum.publicName not in prev_visits:
-                relevant_museums.append(museum)
-        return relevant_museums
+    def noun_mask(self, museum_ids: np.ndarray) -> np.ndarray:
+        # Mask of the given museums over the rows of the noun matrix
+        mask = np.zeros(len(self.noun_matrix) + 1, dtype=bool)
+        mask[self.noun_rows[museum_ids]] = True
+        return mask[:-1]
 
-    def local_spots(self, user: User) -> list[Museum]:
+    def build_context(self, user: User) -> RequestContext:
         """
-        Return the top 5 museums closest to the user's city that are not part of the top 10% of museums.
-        (Low distance, med/low popularity)
+        Compute everything the recommenders need to know about a user once per request.
         """
+        now = pd.Timestamp.now()
+        user_coords = self.context.city_coordinates.get(user.residence)
+        relevant_ids = self.get_relevant_ids(user, now)
+
+        return RequestContext(
+            user_coords=user_coords,
+            closest_cities=self.closest_cities(user_coords, 10),
+            now=now,
+            prev_visits=[m[0].publicName for m in user.previous_visits],
+            relevant_ids=relevant_ids,
+            relevant=self.noun_mask(relevant_ids),
+            user_nouns=user.get_museum_description_nouns(),
+        )
+
+    def find_museums(self, names: list[str], prev_visits: list[str]) -> list[Museum]:
+        # Find museum object in all_museums for all recommendations
+        # New museum objects are created, so that the properties of this user do not end up
+        # on the shared museums in all_museums
+        museum_list = []
+        for name in names:
+            for museum_id in self.ids_by_name.get(name, []):
+                # Set the prev_visit property to True if the museum was visited before
+                # This is to display the "New exibition" tag
+                museum_list.append(
+                    self.catalogue.museum(museum_id, prev_visit=name in prev_visits)
+                )
 
-        user_coords = get_city_coordinates(user.residence)
-        city_distances = self.distance_to_all_museums(user_coords)
-
-        # Sort the cities by distance and get the five closest cities
-        closest_cities = sorted(city_distances, key=lambda x: x[1])[:5]
-        closest_city_names = [city for city, distance in closest_cities]
+        return museum_list
 
-        relevant_museums = self.get_relevant_museums(user)
+    def recommend_all(self, user: User) -> Recommendations:
+        """
+        Return the perfect matches, hidden gems, local spots and museums visited by similar
+        members of a user, sharing the work the recommenders have in common.
+        """
+        context = self.build_context(user)
+        local_spots = self.local_spots(user, context)
+        return Recommendations(
+            perfect_matches=self.perfect_matches(user, context, local_spots),
+            hidden_gems=self.hidden_gems(user, context),
+            local_spots=local_spots,
+            also_visited=self.also_visited(user, context),
+        )
+
+    def local_spots(self, user: User, context: RequestContext = None) -> list[Museum]:
+        """
+        Return the top 5 museums closest to the user's city that are not part of the top 10% of museums.
+        (Low distance, med/low popularity)
+        """
+        context = context or self.build_context(user)
 
-        # Filter museums in the closest cities
-        closest_museums = [
-            museum
-            for museum in relevant_museums
-            if museum.city in closest_city_names
-        ]
+        # The less popular museums in the five closest cities, of the relevant museums
+        candidates = self.in_cities(context.closest_cities[:5]) & self.popularity.below(
+            self.quantile
+        )
+        museum_ids = context.relevant_ids[candidates[context.relevant_ids]]
 
         # Calculate distances to the museums in the closest cities
-        distances = []
-        for museum in closest_museums:
-            popularity = museums_dict[museum.publicName]["n_visits"]
-            if popularity < popularity_threshold:
-                distance = haversine(user_coords, (museum.lat, museum.lng))
-                distances.append((museum, distance))
-                museum.distance_from_user = distance
+        distances = haversine_many(
+            context.user_coords,
+            self.catalogue.lats[museum_ids],
+            self.catalogue.lngs[museum_ids],
+        )
 
         # Sort the museums by distance and return the top 5 closest museums
-        closest_museums_sorted = sorted(distances, key=lambda x: x[1])[:N_RECS]
-
-        museum_list = [museum for museum, distance in closest_museums_sorted if distance < 50]
-        for museum in museum_list:
-            if museum.publicName in user.previous_visits:
-                museum.prev_visit = True
-
-        return museum_list
+        closest = np.argsort(distances, kind="stable")[: self.n_recs]
+
+        return [
+            self.catalogue.museum(
+                int(museum_ids[i]),
+                distance_from_user=float(distances[i]),
+                prev_visit=self.catalogue.columns["publicName"][museum_ids[i]]
+                in context.prev_visits,
+            )
+            for i in closest
+            if distances[i] < 50
+        ]
 
-    def hidden_gems(self, user: User) -> list[Museum]:
+    def hidden_gems(self, user: User, context: RequestContext = None) -> list[Museum]:
         """
         Return 5 museums that are in the bottom 25% of popularity and have high overlap with the user.
         (High interest, low popularity)
         """
-
-        smaller_museums = [
-            museum
-            for museum in self.all_museums
-            if museums_dict[museum.publicName]["n_visits"] <= bottom_threshold
-        ]
-
-        recs = {}
-        user_nouns = user.get_museum_description_nouns()
-        prev_visits = [m[0].publicName for m in user.previous_visits]
-
-        relevant_museums = self.get_relevant_museums(user)
-        rel_mus = []
-        for museum in relevant_museums:
-            rel_mus.append(museum.publicName)
-
-        for museum in museums_dict.keys():
-
-            score = 0
-
-            if museum in rel_mus:
-                museum_nouns = museums_dict[museum]["Nouns"]
-                museum_l = len(set(museum_nouns))
-                common_l = len(set(user_nouns) & set(museum_nouns))
-
-                if museum_l > 0:
-                    score += common_l / museum_l
-                if score >= THRESHOLD:
-                    recs[museum] = score
+        context = context or self.build_context(user)
 
         # Sort the recommendations by score in descending order and return the top 5
-        sorted_recs = sorted(recs.items(), key=lambda item: item[1], reverse=True)[:N_RECS]
-        print(sorted_recs)
+        sorted_recs = self.noun_matrix.top_matches(
+            context.user_nouns, context.relevant, self.n_recs, self.threshold
+        )
+        return self._hidden_gems(sorted_recs, context)
 
-        # Find museum object in all_museums for all recommendations
-        museum_list = []
+    def _hidden_gems(self, sorted_recs: list, context: RequestContext) -> list[Museum]:
         recommended_museums = [rec[0] for rec in sorted_recs]
+        return self.find_museums(recommended_museums, context.prev_visits)
 
-        for museum_name in recommended_museums:
-            for museum in self.all_museums:
-                if museum.publicName == museum_name:
-                    museum_list.append(museum)
-
-                    # Set the prev_visit property to True if the museum was visited before
-                    # This is to display the "New exibition" tag
-                    if museum.publicName in prev_visits:
-                        museum.prev_visit = True
-
-        return museum_list
+    @cached_property
+    def museum_index(self):
+        # Search index over the museum vectors, whose rows are the rows of the noun matrix
+        return build_index(self.context.museum_vectors)
 
-    def perfect_matches(self, user: User) -> list[tuple[Museum, float]]:
+    def similar_museums(self, user: User, context: RequestContext = None) -> list[Museum]:
+        """
+        Return the museums whose vectors are closest to the mean vector of the museums the
+        user visited, so museums with related nouns match as well as the same nouns.
+        (High interest)
+        """
+        context = context or self.build_context(user)
+
+        visited_rows = self.noun_rows[[visit.museum.id for visit in user.previous_visits]]
+        visited_rows = visited_rows[visited_rows < len(self.noun_matrix)]
+        if len(visited_rows) == 0:
+            return []
+        query = normalise(self.museum_index.vectors[visited_rows].mean(axis=0))
+
+        rows, similarities = self.museum_index.search(query, context.relevant, self.n_recs)
+        recommended_museums = [
+            self.noun_matrix.names[row]
+            for row, similarity in zip(rows, similarities)
+            if similarity > 0
+        ]
+        return self.find_museums(recommended_museums, context.prev_visits)
+
+    @cached_property
+    def covisitation_rows(self) -> np.ndarray:
+        # The row in the noun matrix of every row of the co-visitation matrix, or
+        # len(noun_matrix) when the museum has no nouns
+        return np.array(
+            [
+                self.noun_matrix.row_of.get(name, len(self.noun_matrix))
+                for name in self.context.covisitation.names
+            ],
+            dtype=np.int64,
+        )
+
+    def also_visited(self, user: User, context: RequestContext = None) -> list[Museum]:
+        """
+        Return the museums most often visited by the members who visited the same museums
+        as the user, recent visits counting more.
+        (Members like you)
+        """
+        context = context or self.build_context(user)
+
+        covisitation = self.context.covisitation
+        scores = covisitation.scores(context.prev_visits)
+        candidates = np.append(context.relevant, False)[self.covisitation_rows]
+        recommended_museums = covisitation.top(scores, candidates, self.n_recs)
+        return self.find_museums(recommended_museums, context.prev_visits)
+
+    def perfect_matches(
+        self,
+        user: User,
+        context: RequestContext = None,
+        local_spots: list[Museum] = None,
+    ) -> list[tuple[Museum, float]]:
         """
         Return 5 museums that have the highest overlap with the user based on previous visits and location.
         (High interest, med/low distance)
         """
-        user_coords = get_city_coordinates(user.residence)
-        city_distances = self.distance_to_all_museums(user_coords)
-
-        # Sort the cities by distance and get the five closest cities
-        closest_cities = sorted(city_distances, key=lambda x: x[1])[:10]
-        closest_city_names = [city for city, distance in closest_cities]
-
-        # Filter museums in the closest cities
-        closest_museums = [
-            museum.publicName
-            for museum in self.all_museums
-            if museum.city in closest_city_names
-        ]
-
-        recs = {}
-        user_nouns = user.get_museum_description_nouns()
-        prev_visits = [m[0].publicName for m in user.previous_visits]
-        relevant_museums = self.get_relevant_museums(user)
-        rel_mus = []
-        for museum in relevant_museums:
-            rel_mus.append(museum.publicName)
-
-        for museum in museums_dict.keys():
-            score = 0
-
-            if museum in rel_mus:
-                museum_nouns = museums_dict[museum]["Nouns"]
-                museum_l = len(set(museum_nouns))
-                common_l = len(set(user_nouns) & set(museum_nouns))
-
-                if museum_l > 0:
-                    score += common_l / museum_l
-                if museum in closest_museums:
-                    score *= BOOST
-                if score >= THRESHOLD:
-                    recs[museum] = score
-
-        # Sort the recommendations by score in descending order and return the top 5
-        sorted_recs = sorted(recs.items(), key=lambda item: item[1], reverse=True)[:N_RECS]
-
-        # Find museum object in all_museums for all recommendations
-        museum_list = []
+        context = context or self.build_context(user)
+
+        # Museums in the ten closest cities get a boost. Sort the recommendations by score in
+        # descending order and return the top 5
+        sorted_recs = self.noun_matrix.top_matches(
+            context.user_nouns,
+            context.relevant,
+            self.n_recs,
+            self.threshold,
+            boosted=self.nearby(context),
+            boost=self.boost,
+        )
+        return self._perfect_matches(user, context, sorted_recs, local_spots)
+
+    def nearby(self, context: RequestContext) -> np.ndarray:
+        # Mask of the museums in the ten closest cities over the rows of the noun matrix
+        nearby = self.in_cities(context.closest_cities)
+        return self.noun_mask(self.recommended_ids[nearby[self.recommended_ids]])
+
+    def _perfect_matches(
+        self,
+        user: User,
+        context: RequestContext,
+        sorted_recs: list,
+        local_spots: list[Museum] = None,
+    ) -> list[Museum]:
         recommended_museums = [rec[0] for rec in sorted_recs]
-
-        for museum_name in recommended_museums:
-            for museum in self.all_museums:
-                if museum.publicName == museum_name:
-                    museum_list.append(museum)
-
-                    # Set the prev_visit property to True if the museum was visited before
-                    # This is to display the "New exibition" tag
-                    if museum.publicName in prev_visits:
-                        museum.prev_visit = True
+        museum_list = self.find_museums(recommended_museums, context.prev_visits)
 
         if len(museum_list) < 5:
-            additional_museums = self.local_spots(user)[: N_RECS - len(museum_list)]
-            museum_list.extend(additional_museums)
+            if local_spots is None:
+                local_spots = self.local_spots(user, context)
+            museum_list.extend(local_spots[: self.n_recs - len(museum_list)])
 
         return museum_list
+
+    def recommend_batch(self, person_ids: Iterable[str]) -> list[tuple[str, Recommendations]]:
+        """
+        Return the recommendations of many members, the same as recommend_all gives for each
+        of them. The content scores of all members are computed in one matrix product, so
+        pass the members in chunks of a few hundred to a few thousand.
+
+        Parameters:
+        person_ids (Iterable): PersonIDs; the ones that are not a member are left out.
+
+        Returns:
+        list: (PersonID, Recommendations) tuples, in the order of person_ids.
+        """
+        users, contexts = [], []
+        for person_id in person_ids:
+            try:
+                user = User(person_id, self.context)
+            except KeyError:
+                continue
+            users.append(user)
+            contexts.append(self.build_context(user))
+        if not users:
+            return []
+
+        scores = self.noun_matrix.batch_scores([context.user_nouns for context in contexts])
+        boosted_scores = scores.copy()
+        boosted_scores[np.array([self.nearby(context) for context in contexts])] *= self.boost
+
+        results = []
+        for user, context, user_scores, user_boosted_scores in zip(
+            users, contexts, scores, boosted_scores
+        ):
+            # The same selection as top_matches makes from the scores of a single user
+            hidden_gems = self.noun_matrix.top_n(
+                user_scores, context.relevant & (user_scores >= self.threshold), self.n_recs
+            )
+            perfect_matches = self.noun_matrix.top_n(
+                user_boosted_scores,
+                context.relevant & (user_boosted_scores >= self.threshold),
+                self.n_recs,
+            )
+            local_spots = self.local_spots(user, context)
+            results.append(
+                (
+                    user.person_id,
+                    Recommendations(
+                        perfect_matches=self._perfect_matches(
+                            user, context, perfect_matches, local_spots
+                        ),
+                        hidden_gems=self._hidden_gems(hidden_gems, context),
+                        local_spots=local_spots,
+                        also_visited=self.also_visited(user, context),
+                    ),
+                )
+            )
+        return results
+
+
+# The RecSystems of the current and of a newly loaded version of the data, by id(context)
+_rec_systems = {}
+_rec_systems_lock = threading.Lock()
+
+
+def rec_system_for(context: DataContext) -> RecSystem:
+    # The RecSystem of a version of the data, which is built only once per version
+    with _rec_systems_lock:
+        # Drop the versions that are neither current nor asked for, to free their memory
+        current = get_context()
+        for key, rec_system in list(_rec_systems.items()):
+            if rec_system.context is not current and rec_system.context is not context:
+                del _rec_systems[key]
+
+        rec_system = _rec_systems.get(id(context))
+        if rec_system is None:
+            rec_system = _rec_systems[id(context)] = RecSystem(context=context)
+        return rec_system
+
+
+def current_rec_system() -> RecSystem:
+    """
+    Return the RecSystem of the current version of the data. After a reload (see
+    data.reload_context) the indexes are built again for the new version.
+    """
+    return rec_system_for(get_context())
@@ -0,0 +1,201 @@
+"""
+Vectorized noun-overlap scoring for the content based recommenders.
+
+Every museum is a row of a sparse museum × noun incidence matrix, so the overlap of a user's
+nouns with all museums is a single sparse matrix-vector product.
+"""
+
+from typing import Iterable
+
+import numpy as np
+from scipy import sparse
+
+
+class NounMatrix:
+    def __init__(self, museum_nouns: dict):
+        """
+        Parameters:
+        museum_nouns (dict): Mapping of museum publicName to the nouns in its description.
+        The order of the museums is kept and used to break ties between equal scores.
+        """
+        self.names = list(museum_nouns)
+        self.row_of = {name: row for row, name in enumerate(self.names)}
+        self.vocabulary = {}
+
+        indptr = [0]
+        indices = []
+        for name in self.names:
+            columns = {
+                self.vocabulary.setdefault(noun, len(self.vocabulary))
+                for noun in museum_nouns[name]
+            }
+            indices.extend(sorted(columns))
+            indptr.append(len(indices))
+
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr),
+            shape=(len(self.names), len(self.vocabulary)),
+        )
+        # Number of distinct nouns of every museum
+        self.lengths = np.diff(self.matrix.indptr)
+
+    def __len__(self):
+        return len(self.names)
+
+    def mask(self, names: Iterable[str]) -> np.ndarray:
+        # Boolean mask over the rows for the given museum names
+        mask = np.zeros(len(self.names), dtype=bool)
+        rows = [self.row_of[name] for name in names if name in self.row_of]
+        mask[rows] = True
+        return mask
+
+    def columns(self, nouns: Iterable[str]) -> np.ndarray:
+        # The columns of the distinct known nouns
+        return np.array(
+            [self.vocabulary[noun] for noun in set(nouns) if noun in self.vocabulary],
+            dtype=np.int64,
+        )
+
+    def user_vector(self, nouns: Iterable[str]) -> np.ndarray:
+        return self._vector(self.columns(nouns))
+
+    def _vector(self, columns: np.ndarray) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary), dtype=np.int32)
+        vector[columns] = 1
+        return vector
+
+    def scores(
+        self, nouns: Iterable[str], boosted: np.ndarray = None, boost: float = 1.0
+    ) -> np.ndarray:
+        """
+        Share of the distinct nouns of every museum that also occur in the given nouns,
+        multiplied by boost for the museums in the boosted mask.
+        """
+        return self._scores(self.columns(nouns), boosted, boost)
+
+    def _scores(
+        self, columns: np.ndarray, boosted: np.ndarray = None, boost: float = 1.0
+    ) -> np.ndarray:
+        common = self.matrix @ self._vector(columns)
+        scores = np.zeros(len(self.names))
+        np.divide(common, self.lengths, out=scores, where=self.lengths > 0)
+        if boosted is not None:
+            scores[boosted] *= boost
+        return scores
+
+    def batch_scores(self, nouns: list) -> np.ndarray:
+        """
+        The scores of many users at once, as one sparse matrix-matrix product.
+
+        Parameters:
+        nouns (list): The nouns of every user.
+
+        Returns:
+        np.ndarray: Users × museums array, row i equal to scores(nouns[i]).
+        """
+        indptr = [0]
+        indices = []
+        for user_nouns in nouns:
+            indices.extend(self.columns(user_nouns))
+            indptr.append(len(indices))
+        users = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr),
+            shape=(len(nouns), len(self.vocabulary)),
+        )
+
+        common = (users @ self.matrix.T).toarray()
+        scores = np.zeros(common.shape)
+        np.divide(common, self.lengths, out=scores, where=self.lengths > 0)
+        return scores
+
+    def top_n(
+        self, scores: np.ndarray, candidates: np.ndarray, n: int
+    ) -> list[tuple[str, float]]:
+        """
+        Return the n candidates with the highest score as (publicName, score) tuples, sorted
+        by score in descending order. Ties keep the order of the museums in the matrix.
+        """
+        rows = np.flatnonzero(candidates)
+        return self._top_rows(rows, scores[rows], n)
+
+    def _top_rows(
+        self, rows: np.ndarray, scores: np.ndarray, n: int
+    ) -> list[tuple[str, float]]:
+        # The n best of the given (sorted) rows, where scores[i] is the score of rows[i]
+        if len(rows) > n > 0:
+            # Keep every row that scores at least as high as the n-th best one
+            nth_best = scores[np.argpartition(-scores, n - 1)[:n]].min()
+            keep = scores >= nth_best
+            rows, scores = rows[keep], scores[keep]
+
+        order = np.lexsort((rows, -scores))[:n]
+        return [(self.names[rows[i]], float(scores[i])) for i in order]
+
+
+class InvertedNounIndex(NounMatrix):
+    """
+    The noun matrix with a posting list per noun: the museums whose description contains it.
+
+    top_matches() reads only the posting lists of the user's nouns, so it touches only the
+    museums that share at least one noun with the user, and its cost grows with the user's
+    vocabulary rather than with the size of the catalogue.
+    """
+
+    # Above this share of all (museum, noun) pairs, reading the posting lists is slower
+    # than the sparse matrix-vector product over all museums
+    MAX_POSTING_SHARE = 0.25
+
+    def __init__(self, museum_nouns: dict):
+        super().__init__(museum_nouns)
+        postings = self.matrix.tocsc()
+        postings.sort_indices()
+        self.posting_indptr = postings.indptr
+        self.posting_rows = postings.indices
+
+    def overlap(self, columns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the rows of the museums having at least one of the given noun columns, and
+        the number of those nouns they have.
+        """
+        if len(columns) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        postings = np.concatenate(
+            [
+                self.posting_rows[self.posting_indptr[column] : self.posting_indptr[column + 1]]
+                for column in columns
+            ]
+        )
+        counts = np.bincount(postings, minlength=len(self.names))
+        rows = np.flatnonzero(counts)
+        return rows, counts[rows]
+
+    def top_matches(
+        self,
+        nouns: Iterable[str],
+        candidates: np.ndarray,
+        n: int,
+        threshold: float,
+        boosted: np.ndarray = None,
+        boost: float = 1.0,
+    ) -> list[tuple[str, float]]:
+        """
+        The same as top_n(scores, candidates & (scores >= threshold), n) with
+        scores = scores(nouns, boosted, boost).
+        """
+        columns = self.columns(nouns)
+        postings = (self.posting_indptr[columns + 1] - self.posting_indptr[columns]).sum()
+        if threshold <= 0 or postings > self.MAX_POSTING_SHARE * self.matrix.nnz:
+            # Museums without common nouns can be returned, or the user shares common nouns
+            # with most of the museums
+            scores = self._scores(columns, boosted, boost)
+            return self.top_n(scores, candidates & (scores >= threshold), n)
+
+        rows, common = self.overlap(columns)
+        keep = candidates[rows]
+        rows, common = rows[keep], common[keep]
+
+        scores = common / self.lengths[rows]
+        if boosted is not None:
+            scores[boosted[rows]] *= boost
+        keep = scores >= threshold
+        return self._top_rows(rows[keep], scores[keep], n)
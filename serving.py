@@ -0,0 +1,206 @@
+"""
+Concurrent serving of the recommendations.
+
+The sections of the recommendations of a member are computed at the same time in a bounded
+thread pool (the heavy parts run in NumPy, which releases the GIL). Only the perfect
+matches wait for the local spots, which they are filled up with. Requests for a member
+whose recommendations are already being computed wait for that computation instead of
+starting another one. A request waits at most the deadline; sections that are not
+finished by then are left out of the response, but they keep running, so the complete
+result still ends up in the cache.
+
+Without a fixed RecSystem the service uses the one of the current version of the data, so
+after a reload new requests are computed on the new version while the requests that already
+started finish on the old one.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from cache import RecommendationCache
+from data import User
+from recommenders import RecSystem, Recommendations, current_rec_system
+
+# Number of threads computing sections, 0 computes them one after another in the request
+RECOMMENDATION_WORKERS = int(os.environ.get("RECOMMENDATION_WORKERS", 8))
+# Seconds a request waits for its recommendations, 0 waits until they are done
+RECOMMENDATION_DEADLINE = float(os.environ.get("RECOMMENDATION_DEADLINE", 5))
+
+SECTIONS = Recommendations._fields
+
+
+class _Job:
+    # One in-flight computation of the recommendations of a member
+    def __init__(self):
+        self.ready = threading.Event()  # set once the sections are submitted
+        self.user = None
+        self.sections = {}  # section name -> Future
+        self.error = None
+
+
+def _completed(fn, *args) -> Future:
+    # Run fn in the calling thread, with the result in a Future like a submitted task
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _then(future: Future, submit) -> Future:
+    # A Future of the task submit(result of future) starts once future is done. When future
+    # failed, the task gets None instead.
+    chained = Future()
+
+    def copy(task: Future):
+        if task.exception() is not None:
+            chained.set_exception(task.exception())
+        else:
+            chained.set_result(task.result())
+
+    def start(_):
+        result = future.result() if future.exception() is None else None
+        try:
+            submit(result).add_done_callback(copy)
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(start)
+    return chained
+
+
+class RecommendationService:
+    def __init__(
+        self,
+        rec_system: RecSystem = None,
+        cache: RecommendationCache = None,
+        max_workers: int = RECOMMENDATION_WORKERS,
+        deadline: float = RECOMMENDATION_DEADLINE,
+    ):
+        self._rec_system = rec_system
+        self.cache = cache if cache is not None else RecommendationCache()
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers) if max_workers > 0 else None
+        self.coalesced = 0
+        self.timeouts = 0
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def recommend(self, key: str) -> tuple:
+        """
+        Return the user, their recommendations and whether all sections are complete.
+        Sections that missed the deadline are empty lists.
+        """
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached + (True,)
+
+        start = time.monotonic()
+        with self._lock:
+            job = self._jobs.get(key)
+            leader = job is None
+            if leader:
+                job = self._jobs[key] = _Job()
+            else:
+                self.coalesced += 1
+
+        if leader:
+            self._start(key, job)
+        else:
+            # The leader loads the user in its own request, which does not take long
+            job.ready.wait()
+        if job.error is not None:
+            raise job.error
+
+        done, _ = wait(job.sections.values(), self._remaining(start))
+        recommendations = Recommendations(
+            **{
+                name: future.result() if future in done else []
+                for name, future in job.sections.items()
+            }
+        )
+        complete = len(done) == len(SECTIONS)
+        if not complete:
+            with self._lock:
+                self.timeouts += 1
+        return job.user, recommendations, complete
+
+    @property
+    def rec_system(self) -> RecSystem:
+        return self._rec_system or current_rec_system()
+
+    def _remaining(self, start: float):
+        if not self.deadline:
+            return None
+        return max(0.0, self.deadline - (time.monotonic() - start))
+
+    def _start(self, key: str, job: _Job):
+        version = self.cache.version_of(key)
+        # The whole job runs on one version of the data, even when it is reloaded meanwhile
+        rec_system = self.rec_system
+        try:
+            job.user = User(key, rec_system.context)
+            context = rec_system.build_context(job.user)
+        except Exception as e:
+            job.error = e
+            self._finish(key, job)
+            job.ready.set()
+            raise
+
+        def submit(method, *args) -> Future:
+            if self.executor is None:
+                return _completed(method, *args)
+            # Run in a copy of the request's context, so the stages are timed as part of
+            # the request (see metrics.py)
+            return self.executor.submit(contextvars.copy_context().run, method, *args)
+
+        for name in SECTIONS:
+            if name != "perfect_matches":
+                job.sections[name] = submit(getattr(rec_system, name), job.user, context)
+        # The perfect matches are filled up with the local spots, so they start once those
+        # are done instead of computing them again
+        job.sections["perfect_matches"] = _then(
+            job.sections["local_spots"],
+            lambda local_spots: submit(
+                rec_system.perfect_matches, job.user, context, local_spots
+            ),
+        )
+        job.ready.set()
+
+        pending = [len(SECTIONS)]
+
+        def section_done(_):
+            with self._lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            self._finish(key, job, version)
+
+        for future in job.sections.values():
+            future.add_done_callback(section_done)
+
+    def _finish(self, key: str, job: _Job, version: tuple = None):
+        # The result is cached before the job is removed, so no request starts it again
+        if job.error is None and not any(
+            future.exception() for future in job.sections.values()
+        ):
+            recommendations = Recommendations(
+                **{name: future.result() for name, future in job.sections.items()}
+            )
+            self.cache.set(key, (job.user, recommendations), version)
+        with self._lock:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._jobs),
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "deadline": self.deadline,
+            }
@@ -0,0 +1,195 @@
+"""
+Binary snapshot of the startup data.
+
+    python snapshot.py    (or: flask build-snapshot)
+
+reads every CSV file once, cleans it and writes the tables as uncompressed Arrow (Feather)
+files to data/snapshot/, together with the user store arrays as .npy files. At startup the
+snapshot is used when it is up to date with the CSV files, otherwise the CSV files are read
+as before. The user store arrays are memory-mapped, so all workers share their pages. The
+tables are read much faster than the CSV files, but every worker converts them into its
+own pandas copy.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from ast import literal_eval
+
+import pandas as pd
+
+from userstore import UserStore
+
+# The folder with the CSV files, e.g. a synthetic dataset for the benchmarks
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshot")
+# Bump this when the cleaning of the tables below changes, so that old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+# List of museums which no longer exists, so we remove them from the dataset
+OLD_MUSEUMS = ["Wereld van Wenters"]
+
+
+def read_members() -> pd.DataFrame:
+    return pd.read_csv(
+        os.path.join(DATA_DIR, "members.csv"),
+        usecols=["PersonID", "Woonplaats", "Provincie", "Leeftijd"],
+        low_memory=False,
+    )
+
+
+def read_visits() -> pd.DataFrame:
+    visits_df = pd.read_csv(
+        os.path.join(DATA_DIR, "visits.csv"),
+        usecols=[
+            "PersonID",
+            "BezoekDatum",
+            "MuseumCode",
+            "MuseumNaam",
+        ],
+        low_memory=False,
+    )
+    # If the user has visited a museum more than once, we only keep the most recent visit
+    visits_df = visits_df.sort_values(by=["PersonID", "BezoekDatum"], ascending=False)
+    return visits_df.drop_duplicates(subset=["PersonID", "MuseumNaam"])
+
+
+def read_museums() -> pd.DataFrame:
+    museums_df = pd.read_csv(os.path.join(DATA_DIR, "museums.csv"), low_memory=False)
+    museums_df = museums_df[museums_df["language"] == "nl"].copy()
+    museums_df["city"] = museums_df["city"].str.upper()
+    return museums_df[~museums_df["publicName"].isin(OLD_MUSEUMS)]
+
+
+def read_events() -> pd.DataFrame:
+    return pd.read_csv(os.path.join(DATA_DIR, "events.csv"), low_memory=False)
+
+
+def read_topics() -> pd.DataFrame:
+    return pd.read_csv(os.path.join(DATA_DIR, "topics.csv"))
+
+
+def read_cities() -> pd.DataFrame:
+    return pd.read_csv(os.path.join(DATA_DIR, "cities_grouped.csv"))
+
+
+def read_museum_nouns() -> pd.DataFrame:
+    museums_short = pd.read_csv(os.path.join(DATA_DIR, "museum_nouns_and_visits.csv"))
+    # The nouns are stored as a string representation of a list
+    museums_short["Nouns"] = museums_short["Nouns"].map(literal_eval)
+    return museums_short
+
+
+# Table name -> (source file, function reading and cleaning it)
+TABLES = {
+    "members": ("members.csv", read_members),
+    "visits": ("visits.csv", read_visits),
+    "museums": ("museums.csv", read_museums),
+    "events": ("events.csv", read_events),
+    "topics": ("topics.csv", read_topics),
+    "cities": ("cities_grouped.csv", read_cities),
+    "museum_nouns": ("museum_nouns_and_visits.csv", read_museum_nouns),
+}
+
+
+def source_stats(tables: list[str] = None) -> dict:
+    # The size and modification time of the source files of the tables (all by default)
+    stats = {}
+    for name, (source, _) in TABLES.items():
+        if tables is not None and name not in tables:
+            continue
+        stat = os.stat(os.path.join(DATA_DIR, source))
+        stats[source] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return stats
+
+
+def data_version(tables: list[str] = None) -> str:
+    # A short id of the current source files of the tables (all by default), which changes
+    # when any of them changes
+    stats = json.dumps(source_stats(tables), sort_keys=True)
+    return hashlib.sha1(stats.encode()).hexdigest()[:12]
+
+
+def is_fresh(directory: str = SNAPSHOT_DIR) -> bool:
+    # The snapshot is used only when it was built from the current CSV files
+    try:
+        with open(os.path.join(directory, "manifest.json")) as file:
+            manifest = json.load(file)
+        return (
+            manifest["version"] == SNAPSHOT_VERSION
+            and manifest["sources"] == source_stats()
+        )
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def _from_arrow(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Arrow stores missing values as None; the code expects NaN, like read_csv gives
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), float("nan"))
+    if name == "museum_nouns":
+        df["Nouns"] = df["Nouns"].map(list)
+    return df
+
+
+def load_table(name: str, directory: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    if is_fresh(directory):
+        from pyarrow import feather
+
+        # Read into memory: to_pandas() copies the columns anyway, so mapping the file
+        # would not share them between the workers
+        table = feather.read_table(os.path.join(directory, f"{name}.arrow"))
+        return _from_arrow(name, table.to_pandas())
+    return TABLES[name][1]()
+
+
+def load_user_store(read_tables, directory: str = SNAPSHOT_DIR) -> UserStore:
+    # read_tables returns the (members_df, visits_df) to build the store from, when the
+    # snapshot is not up to date
+    if is_fresh(directory):
+        return UserStore.load(os.path.join(directory, "users"))
+    return UserStore.from_tables(*read_tables())
+
+
+def build_snapshot(directory: str = SNAPSHOT_DIR):
+    from pyarrow import feather
+
+    from covisitation import build_covisitation, save_covisitation
+
+    os.makedirs(os.path.join(directory, "users"), exist_ok=True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    # Take the stats before reading, so that files changed meanwhile make the snapshot stale
+    sources = source_stats()
+    visits_version = data_version(["visits"])
+
+    tables = {}
+    for name, (source, read) in TABLES.items():
+        print(f"Reading {source}", file=sys.stderr)
+        tables[name] = read()
+        feather.write_feather(
+            tables[name].reset_index(drop=True),
+            os.path.join(directory, f"{name}.arrow"),
+            compression="uncompressed",
+        )
+
+    user_store = UserStore.from_tables(tables["members"], tables["visits"])
+    user_store.save(os.path.join(directory, "users"))
+
+    # The co-visitation only depends on the visits, and is too slow to build on a request
+    print("Building the museum co-visitation", file=sys.stderr)
+    save_covisitation(
+        build_covisitation(user_store, processes=os.cpu_count() or 1), visits_version
+    )
+
+    # The manifest is written last, so an interrupted build leaves no fresh snapshot
+    with open(manifest_path, "w") as file:
+        json.dump({"version": SNAPSHOT_VERSION, "sources": sources}, file, indent=2)
+
+
+if __name__ == "__main__":
+    build_snapshot()
+    print(f"Snapshot written to '{SNAPSHOT_DIR}'.")
@@ -0,0 +1,9 @@
+from app import app
+
+
+def test_routes_reject_missing_and_unknown_members():
+    client = app.test_client()
+    assert client.get("/recommendations/login").status_code == 400
+    assert client.get("/recommendations/not-a-member").status_code == 404
+    assert client.get("/id/not-a-member").status_code == 404
+    assert client.get("/recommendations/random").status_code == 200
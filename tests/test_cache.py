@@ -0,0 +1,78 @@
+import time
+
+from cache import GENERATIONS_PER_ENTRY, CardCache, RecommendationCache
+from events import Event
+
+
+def test_cache_evicts_least_recently_used():
+    cache = RecommendationCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_expires_and_invalidates():
+    cache = RecommendationCache(maxsize=10, ttl=0.01)
+    assert cache.get_or_compute("a", lambda: 1) == 1
+    time.sleep(0.02)
+    assert cache.get_or_compute("a", lambda: 2) == 2
+
+    cache.ttl = 60
+    cache.set("b", 3)
+    cache.invalidate("b")
+    assert cache.get("b") is None
+
+    cache.set("c", 4)
+    cache.invalidate()
+    assert cache.get("c") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_card_cache_renders_again_when_the_events_change():
+    class Catalogue:
+        pass
+
+    class Museum:
+        def __init__(self, catalogue, id, events):
+            self.catalogue, self.id, self.events = catalogue, id, events
+
+    renders = []
+
+    def render(museum, events):
+        renders.append(museum.id)
+        return (museum.id, [event.id for event in events])
+
+    cache = CardCache(render)
+    catalogue = Catalogue()
+    event = Event("Expo", 1, "", None, None, "a")
+    assert cache.get(Museum(catalogue, 0, [event])) == (0, [1])
+    assert cache.get(Museum(catalogue, 0, [event])) == (0, [1])
+    assert renders == [0]
+
+    # Once the event ended, or in a new version of the data, the card is rendered again
+    assert cache.get(Museum(catalogue, 0, [])) == (0, [])
+    assert cache.get(Museum(Catalogue(), 0, [])) == (0, [])
+    assert renders == [0, 0, 0]
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_generations_stay_bounded():
+    cache = RecommendationCache(maxsize=1, ttl=60)
+    for person_id in range(GENERATIONS_PER_ENTRY):
+        cache.invalidate(str(person_id))
+    assert len(cache._generations) == GENERATIONS_PER_ENTRY
+
+    # One member more starts a new version instead
+    version = cache.version
+    cache.invalidate("new")
+    assert cache.version == version + 1 and not cache._generations
+
+    cache.invalidate("a")
+    cache.invalidate()
+    assert not cache._generations
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from covisitation import Covisitation, build_covisitation, load_covisitation
+from userstore import UserStore
+
+
+def make_store():
+    members_df = pd.DataFrame(
+        {"PersonID": [1, 2, 3, 4], "Woonplaats": ["A"] * 4, "Leeftijd": [30] * 4}
+    )
+    visits = [
+        (1, "Rijks", "20240101"),
+        (1, "Stedelijk", "20240101"),
+        (2, "Rijks", "20240101"),
+        (2, "Stedelijk", "20240101"),
+        (3, "Rijks", "20200101"),
+        (3, "Nemo", "20200101"),
+        (4, "Nemo", "20240101"),
+    ]
+    visits_df = pd.DataFrame(visits, columns=["PersonID", "MuseumNaam", "BezoekDatum"])
+    return UserStore.from_tables(members_df, visits_df)
+
+
+def test_covisitation_weights_recent_visits(tmp_path):
+    store = make_store()
+    covisitation = build_covisitation(store, chunk_members=2)
+
+    scores = covisitation.scores(["Rijks"])
+    row_of = covisitation.row_of
+    # Nemo was visited with Rijks long ago, Stedelijk recently and by more members
+    assert scores[row_of["Stedelijk"]] > scores[row_of["Nemo"]] > 0
+    assert scores[row_of["Rijks"]] == 0
+    candidates = np.ones(len(covisitation), dtype=bool)
+    assert covisitation.top(scores, candidates, 5) == ["Stedelijk", "Nemo"]
+
+    # The chunks and processes give the same matrix
+    parallel = build_covisitation(store, chunk_members=1, processes=2)
+    assert np.allclose(parallel.matrix.toarray(), covisitation.matrix.toarray())
+
+    path = str(tmp_path / "covisitation.npz")
+    covisitation.save(path, "a")
+    assert Covisitation.load(path, "b") is None
+    loaded = Covisitation.load(path, "a")
+    assert loaded.names == covisitation.names
+    assert np.allclose(loaded.matrix.toarray(), covisitation.matrix.toarray())
+
+
+def test_load_covisitation_only_builds_when_asked(tmp_path):
+    store = make_store()
+    path = str(tmp_path / "covisitation.npz")
+
+    # On the request path a missing matrix is empty instead of built
+    assert load_covisitation(store, "v1", path=path).matrix.nnz == 0
+    built = load_covisitation(store, "v1", build=True, path=path)
+    assert built.matrix.nnz > 0
+    assert load_covisitation(store, "v1", path=path).matrix.nnz == built.matrix.nnz
+    # Another version of visits.csv makes it stale
+    assert load_covisitation(store, "v2", path=path).matrix.nnz == 0
@@ -0,0 +1,45 @@
+import numpy as np
+
+from embeddings import ExactIndex, IVFIndex, build_embeddings, load_embeddings, normalise
+
+MUSEUM_NOUNS = {
+    "Kunstmuseum": ["schilderij", "kunst", "schilder", "kunst"],
+    "Schilderijenzaal": ["schilderij", "schilder", "portret"],
+    "Treinmuseum": ["trein", "spoor", "locomotief"],
+    "Spoorwegmuseum": ["trein", "spoor", "station"],
+    "Leeg": [],
+}
+
+
+def test_related_museums_get_close_vectors():
+    vectors = build_embeddings(MUSEUM_NOUNS, dimensions=3)
+    assert vectors.dtype == np.float32 and vectors.shape == (5, 3)
+    assert not vectors[4].any()
+
+    # The closest other museum of both an art and a train museum
+    index = ExactIndex(vectors)
+    rows, _ = index.search(vectors[0], np.array([False, True, True, True, True]), 1)
+    assert rows.tolist() == [1]
+    rows, _ = index.search(vectors[2], np.array([True, True, False, True, True]), 1)
+    assert rows.tolist() == [3]
+
+
+def test_ivf_probing_all_lists_is_exact():
+    rng = np.random.default_rng(1)
+    vectors = normalise(rng.normal(size=(500, 16)).astype(np.float32))
+    candidates = rng.random(500) < 0.7
+    ivf = IVFIndex(vectors, n_lists=10, n_probe=10)
+    exact = ExactIndex(vectors)
+    for query in vectors[:20]:
+        assert ivf.search(query, candidates, 5)[0].tolist() == (
+            exact.search(query, candidates, 5)[0].tolist()
+        )
+
+
+def test_load_embeddings_reuses_stored_vectors(tmp_path, capsys):
+    path = str(tmp_path / "vectors.npz")
+    vectors = load_embeddings(MUSEUM_NOUNS, dimensions=3, path=path)
+    assert "Building" in capsys.readouterr().err
+
+    assert np.array_equal(load_embeddings(MUSEUM_NOUNS, dimensions=3, path=path), vectors)
+    assert capsys.readouterr().err == ""
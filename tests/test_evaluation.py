@@ -0,0 +1,24 @@
+from evaluation_validation_perfect_matches import run_evaluation
+
+COUNTS = ["recommender_method", "TP", "FP", "FN"]
+
+
+def test_run_evaluation_is_reproducible():
+    def run(processes):
+        rows = run_evaluation(
+            sample_size=8,
+            number_of_visits_lowerbound=2,
+            test_split_size=0.5,
+            methods=["hidden_gems", "random"],
+            processes=processes,
+            seed=1,
+            output=None,
+        )
+        return [[row[field] for field in COUNTS] for row in rows]
+
+    rows = run(processes=1)
+    assert [row[0] for row in rows] == ["hidden_gems", "random"]
+    assert all(tp + fn > 0 for _, tp, _, fn in rows)
+    # The same seed gives the same counts, however the sample is spread over processes
+    assert run(processes=1) == rows
+    assert run(processes=2) == rows
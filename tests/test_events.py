@@ -0,0 +1,79 @@
+import pandas as pd
+
+from events import EventIndex
+
+
+def test_active_events_expire():
+    events_df = pd.DataFrame(
+        {
+            "name": ["Old", "Short", "Long", "English"],
+            "id": [1, 2, 3, 4],
+            "description": ["", "", "", ""],
+            "startDate": ["2024-01-01T00:00:00+01:00"] * 4,
+            "endDate": [
+                "2024-02-01T00:00:00+01:00",
+                "2024-06-01T00:00:00+02:00",
+                "2025-01-01T00:00:00+01:00",
+                "2025-01-01T00:00:00+01:00",
+            ],
+            "museumId": ["a", "a", "a", "a"],
+            "language": ["nl", "nl", "nl", "en"],
+            "topicIds": ["[1]", "[1, 2]", "[]", "[2]"],
+        }
+    )
+    topics_df = pd.DataFrame({"id": [1, 2], "title": ["Kunst", "Natuur"]})
+    index = EventIndex(events_df, topics_df)
+
+    events = index.active_events("a", now=pd.Timestamp("2024-03-01"))
+    assert [event.name for event in events] == ["Short", "Long"]
+    # The end date keeps its local time
+    assert events[0].endDate == pd.Timestamp("2024-06-01")
+
+    # Once the first active event ends, the cached result is recomputed
+    events = index.active_events("a", now=pd.Timestamp("2024-07-01"))
+    assert [event.name for event in events] == ["Long"]
+
+    assert index.active_events("b") == []
+    assert [(topic.title, count) for topic, count in index.topics("a")] == [
+        ("Kunst", 2),
+        ("Natuur", 1),
+    ]
+
+
+def test_latest_active_starts():
+    events_df = pd.DataFrame(
+        {
+            "name": ["Early", "Late", "Permanent", "Other"],
+            "id": [1, 2, 3, 4],
+            "description": ["", "", "", ""],
+            "startDate": [
+                "2024-01-01T00:00:00+01:00",
+                "2024-05-01T00:00:00+02:00",
+                "2024-09-01T00:00:00+02:00",
+                "2024-02-01T00:00:00+01:00",
+            ],
+            "endDate": [
+                "2025-01-01T00:00:00+01:00",
+                "2024-06-01T00:00:00+02:00",
+                None,
+                "2025-01-01T00:00:00+01:00",
+            ],
+            "museumId": ["a", "a", "a", "b"],
+            "language": ["nl"] * 4,
+            "topicIds": ["[]"] * 4,
+        }
+    )
+    index = EventIndex(events_df, pd.DataFrame({"id": [], "title": []}))
+    codes = index.codes(["a", "b", "c"])
+
+    latest = index.latest_active_starts(pd.Timestamp("2024-05-15"))[codes]
+    assert list(pd.to_datetime(latest[:2])) == [
+        pd.Timestamp("2024-05-01"),
+        pd.Timestamp("2024-02-01"),
+    ]
+    # A museum without events has no latest start
+    assert latest[2] == pd.NaT.value
+
+    # Once "Late" ended, the earlier event is the latest active one
+    latest = index.latest_active_starts(pd.Timestamp("2024-07-01"))[codes]
+    assert pd.Timestamp(latest[0]) == pd.Timestamp("2024-01-01")
@@ -0,0 +1,37 @@
+import json
+import os
+
+from data import User, get_context
+from export import export_recommendations
+from recommenders import current_rec_system
+
+
+def test_recommend_batch_matches_recommend_all():
+    rs = current_rec_system()
+    person_ids = [str(person_id) for person_id in get_context().user_store.member_ids[:50]]
+
+    results = rs.recommend_batch(person_ids + ["not a member"])
+
+    assert [person_id for person_id, _ in results] == person_ids
+    for person_id, recommendations in results:
+        assert recommendations == rs.recommend_all(User(person_id))
+
+
+def test_export_resumes_from_checkpoint(tmp_path):
+    person_ids = [str(person_id) for person_id in get_context().user_store.member_ids[:30]]
+    output = str(tmp_path)
+
+    summary = export_recommendations(output, chunk_size=10, processes=1, person_ids=person_ids)
+    assert summary["computed_chunks"] == 3
+
+    # Only the missing part is computed again
+    os.remove(os.path.join(output, "part-00001.jsonl"))
+    summary = export_recommendations(output, chunk_size=10, processes=1, person_ids=person_ids)
+    assert summary["computed_chunks"] == 1
+
+    records = []
+    for name in sorted(os.listdir(output)):
+        if name.startswith("part-"):
+            with open(os.path.join(output, name)) as file:
+                records.extend(json.loads(line) for line in file)
+    assert [record["PersonID"] for record in records] == person_ids
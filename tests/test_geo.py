@@ -0,0 +1,27 @@
+import random
+
+from geo import GeoIndex, haversine, haversine_many
+
+
+def test_geo_index_matches_haversine():
+    rng = random.Random(7)
+    names = [f"CITY {i}" for i in range(300)]
+    lats = [rng.uniform(50.7, 53.6) for _ in names]
+    lons = [rng.uniform(3.3, 7.3) for _ in names]
+    index = GeoIndex(names, lats, lons)
+
+    for _ in range(20):
+        coord = (rng.uniform(50.7, 53.6), rng.uniform(3.3, 7.3))
+        distances = [haversine(coord, (lat, lon)) for lat, lon in zip(lats, lons)]
+        expected = sorted(zip(distances, names))
+
+        for distance, expected_distance in zip(haversine_many(coord, lats, lons), distances):
+            assert abs(distance - expected_distance) < 1e-9
+
+        nearest = index.nearest(coord, 10)
+        assert [name for name, _ in nearest] == [name for _, name in expected[:10]]
+
+        within = index.within(coord, 25)
+        assert [name for name, _ in within] == [
+            name for distance, name in expected if distance <= 25
+        ]
@@ -0,0 +1,43 @@
+import os
+
+from PIL import Image
+
+from images import DerivativeIndex, build_derivatives
+
+
+def test_build_derivatives_is_incremental(tmp_path):
+    source_dir, output_dir = tmp_path / "originals", tmp_path / "derivatives"
+    source_dir.mkdir()
+    Image.new("RGB", (1200, 800), "red").save(source_dir / "a.jpg")
+    Image.new("RGB", (400, 400), "blue").save(source_dir / "b.jpg")
+
+    manifest = build_derivatives(source_dir, output_dir, [300, 600], processes=1)
+    files = manifest["images"]["a"]["files"]
+    assert set(files) == {"webp", "jpeg"}
+    with Image.open(output_dir / files["jpeg"]["300"]) as image:
+        assert image.size == (300, 200)
+    # Smaller originals are not upscaled
+    assert set(manifest["images"]["b"]["files"]["webp"]) == {"300", "400"}
+
+    # Unchanged and touched-but-identical images keep their derivatives
+    os.utime(source_dir / "a.jpg", ns=(0, 0))
+    assert build_derivatives(source_dir, output_dir, [300, 600], processes=1)["images"]["a"][
+        "files"
+    ] == files
+
+    # Changed images get new names, deleted images lose their derivatives, other files stay
+    (output_dir / "notes.txt").write_text("")
+    Image.new("RGB", (1200, 800), "green").save(source_dir / "a.jpg")
+    os.remove(source_dir / "b.jpg")
+    manifest = build_derivatives(source_dir, output_dir, [300, 600], processes=1)
+    assert manifest["images"]["a"]["files"]["jpeg"]["300"] != files["jpeg"]["300"]
+    assert sorted(os.listdir(output_dir)) == sorted(
+        [name for sizes in manifest["images"]["a"]["files"].values() for name in sizes.values()]
+        + ["manifest.json", "notes.txt"]
+    )
+
+    index = DerivativeIndex(manifest)
+    srcset = index.srcset("/static/museum_images/a.jpg", "webp")
+    assert srcset.startswith("/images/a-300.") and srcset.endswith(".webp 600w")
+    assert index.src("/static/museum_images/a.jpg").endswith(".jpg")
+    assert index.src("/static/museum_images/missing.jpg") == "/static/museum_images/missing.jpg"
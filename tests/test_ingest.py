@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from cache import RecommendationCache
+from ingest import ingest_visits, parse_csv, parse_jsonl
+from userstore import UserStore
+
+
+def make_store():
+    members = pd.DataFrame(
+        {"PersonID": ["a", "b"], "Woonplaats": ["Utrecht", "Delft"], "Leeftijd": [30, 40]}
+    )
+    visits = pd.DataFrame(
+        {
+            "PersonID": ["a", "a"],
+            "BezoekDatum": [20230105, 20220301],
+            "MuseumCode": [1, 2],
+            "MuseumNaam": ["Centraal Museum", "Rijksmuseum"],
+        }
+    )
+    return UserStore.from_tables(members, visits)
+
+
+def test_ingest_keeps_latest_visit_and_invalidates_changed_members():
+    store = make_store()
+    cache = RecommendationCache()
+    cache.set("a", "recommendations of a")
+    cache.set("b", "recommendations of b")
+    version = cache.version_of("a")
+
+    records = parse_jsonl(
+        '{"PersonID": "a", "BezoekDatum": 20220101, "MuseumNaam": "Centraal Museum"}\n'
+        '{"PersonID": "a", "BezoekDatum": "20240101", "MuseumNaam": "Rijksmuseum"}\n'
+    ) + parse_csv(
+        "PersonID,BezoekDatum,MuseumCode,MuseumNaam\n"
+        "c,20240202,3,Van Gogh Museum\n"
+        "b,20240303,4,\n"
+    )
+    assert ingest_visits(records, store, cache) == {"visits": 3, "members": 2}
+
+    # The older visit to the Centraal Museum is ignored, the newer Rijksmuseum visit wins
+    assert sorted(store.visits("a")) == [
+        ("Centraal Museum", pd.Timestamp("2023-01-05")),
+        ("Rijksmuseum", pd.Timestamp("2024-01-01")),
+    ]
+    assert store.visits("c") == [("Van Gogh Museum", pd.Timestamp("2024-02-02"))]
+    assert store.visits("b") == []
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "recommendations of b"
+    # A value computed before the new visits is not cached
+    cache.set("a", "stale", version)
+    assert cache.get("a") is None
+
+
+def test_ingest_rejects_invalid_records():
+    with pytest.raises(ValueError):
+        ingest_visits([{"PersonID": "a", "BezoekDatum": "2024-01-01", "MuseumNaam": "x"}],
+                      make_store(), RecommendationCache())
+    with pytest.raises(ValueError):
+        parse_jsonl("{not json")
+    for line in ("[1]", '"x"', "5"):
+        with pytest.raises(ValueError, match="not a JSON object"):
+            parse_jsonl('{"PersonID": "a"}\n' + line)
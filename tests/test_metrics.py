@@ -0,0 +1,32 @@
+import metrics
+
+
+class Example:
+    def work(self):
+        with metrics.stage("inner"):
+            return self.value
+
+    @property
+    def value(self):
+        return 42
+
+
+def test_instrumented_stages_are_recorded_and_profiled():
+    metrics.instrument(Example, ["work", "value"])
+    metrics.instrument(Example, ["work"])  # instrumenting twice has no effect
+
+    with metrics.profile() as profile, metrics.stage("request"):
+        assert Example().work() == 42
+
+    stacks = [line.rsplit(" ", 1)[0] for line in profile.collapsed().splitlines()]
+    assert stacks == [
+        "request",
+        "request;Example.work",
+        "request;Example.work;inner",
+        "request;Example.work;inner;Example.value",
+    ]
+
+    text = metrics.prometheus_text()
+    assert "# TYPE recommender_stage_seconds histogram" in text
+    assert 'recommender_stage_seconds_bucket{stage="Example.work",le="+Inf"} 1' in text
+    assert 'recommender_stage_seconds_count{stage="Example.value"} 1' in text
@@ -1,9 +1,10 @@
+from data import PLACEHOLDER_IMAGE_URL
 from recommenders import RecSystem
 
 
 def test_all_museum_have_image():
     rs = RecSystem()
     for museum in rs.all_museums:
-        assert museum.image_url is not None
+        assert museum.image_url != PLACEHOLDER_IMAGE_URL
         assert museum.image_url.endswith(".jpg")
         assert museum.image_url.startswith("/static/museum_images/")
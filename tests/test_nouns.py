@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import nouns
+from nouns import load_noun_index
+
+
+class FakeNLP:
+    # Tags every word as a noun and records the parsed texts
+    def __init__(self, version: str):
+        self.meta = {"version": version}
+        self.parsed = []
+
+    def __call__(self, text):
+        self.parsed.append(text)
+        return [SimpleNamespace(text=word, pos_="NOUN") for word in text.split()]
+
+    def pipe(self, texts, **kwargs):
+        return [self(text) for text in texts]
+
+
+def test_noun_index_reparses_only_what_changed(tmp_path, monkeypatch):
+    path = str(tmp_path / "description_nouns.json")
+    nlp = FakeNLP("3.7.0")
+    monkeypatch.setattr(nouns, "_nlp", nlp)
+
+    descriptions = {"A": "schilderij beeld", "B": "fossiel", "C": "trein"}
+    assert load_noun_index(descriptions, path) == {
+        "A": ["schilderij", "beeld"],
+        "B": ["fossiel"],
+        "C": ["trein"],
+    }
+
+    # Only the changed description is parsed again, and removed museums are dropped
+    nlp.parsed.clear()
+    index = load_noun_index({"A": "schilderij beeld", "B": "dinosaurus"}, path)
+    assert index == {"A": ["schilderij", "beeld"], "B": ["dinosaurus"]}
+    assert nlp.parsed == ["dinosaurus"]
+    assert set(nouns.read_noun_index(path)) == {"A", "B"}
+
+    # A new version of the model parses everything again
+    nlp = FakeNLP("3.8.0")
+    monkeypatch.setattr(nouns, "_nlp", nlp)
+    load_noun_index({"A": "schilderij beeld", "B": "dinosaurus"}, path)
+    assert sorted(nlp.parsed) == ["dinosaurus", "schilderij beeld"]
+
+    # So does another model
+    nlp.parsed.clear()
+    monkeypatch.setattr(nouns, "SPACY_MODEL", "nl_core_news_lg")
+    load_noun_index({"A": "schilderij beeld"}, path)
+    assert nlp.parsed == ["schilderij beeld"]
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from data import PopularityTiers
+
+
+def test_tiers_match_series_quantile():
+    counts = pd.Series([10, 250, 40, 3, 1200, 75, np.nan, 600])
+    visits = np.array([3, 40, 600, np.nan, 1200, 75])
+    tiers = PopularityTiers(visits, counts, quantiles=(0.25, 0.9))
+
+    for quantile in (0.25, 0.8, 0.9):
+        assert tiers.threshold(quantile) == counts.quantile(quantile)
+        expected = [count < counts.quantile(quantile) for count in visits]
+        assert tiers.below(quantile).tolist() == expected
+
+    # The configured quantiles are precomputed, other ones are computed when asked for
+    assert tiers.below(0.9) is tiers.below(0.9)
+    assert 0.8 not in tiers.tiers
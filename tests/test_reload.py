@@ -0,0 +1,40 @@
+import pandas as pd
+
+from data import DataContext, User, get_context, reload_context
+from recommenders import current_rec_system
+
+
+def test_reload_swaps_context_and_keeps_added_visits():
+    old = get_context()
+    old_rec_system = current_rec_system()
+    key = str(old.members_df["PersonID"].iloc[0])
+    museum = old.catalogue.columns["publicName"][0]
+    timestamp = pd.Timestamp("2099-01-01")
+    old.user_store.add_visits([(key, museum, timestamp)])
+    old_user = User(key)
+
+    new = reload_context()
+    try:
+        assert get_context() is new and new is not old
+        assert current_rec_system().context is new
+        # The visits added to the old version are carried over
+        assert (museum, timestamp) in new.user_store.visits(key)
+
+        # Objects of the old version keep working on the old data
+        assert old_user.context is old
+        assert old_rec_system.recommend_all(old_user) is not None
+    finally:
+        new.user_store.overlay.pop(key, None)
+
+
+def test_context_loads_tables_on_first_use():
+    context = DataContext()
+    assert context.city_coordinates is context.city_coordinates
+    assert "cities_df" in vars(context)
+    assert "visits_df" not in vars(context) and "catalogue" not in vars(context)
+
+
+def test_load_leaves_out_the_members_and_visits_tables():
+    context = DataContext().load()
+    assert "catalogue" in vars(context) and "user_store" in vars(context)
+    assert "members_df" not in vars(context) and "visits_df" not in vars(context)
@@ -0,0 +1,71 @@
+import random
+
+from scoring import InvertedNounIndex, NounMatrix
+
+
+def reference_top_n(museum_nouns, user_nouns, relevant, boosted, boost, threshold, n):
+    # The original pure Python scoring loop of perfect_matches and hidden_gems
+    recs = {}
+    for museum in museum_nouns:
+        score = 0
+        if museum in relevant:
+            museum_l = len(set(museum_nouns[museum]))
+            common_l = len(set(user_nouns) & set(museum_nouns[museum]))
+            if museum_l > 0:
+                score += common_l / museum_l
+            if museum in boosted:
+                score *= boost
+            if score >= threshold:
+                recs[museum] = score
+    return sorted(recs.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def test_noun_matrix_matches_reference():
+    rng = random.Random(42)
+    vocabulary = [f"noun{i}" for i in range(40)]
+    museum_nouns = {
+        f"Museum {i}": [rng.choice(vocabulary) for _ in range(rng.randint(0, 12))]
+        for i in range(200)
+    }
+    matrix = NounMatrix(museum_nouns)
+
+    for _ in range(50):
+        user_nouns = [rng.choice(vocabulary + ["unknown"]) for _ in range(rng.randint(0, 30))]
+        relevant = set(rng.sample(list(museum_nouns), 150))
+        boosted = set(rng.sample(list(museum_nouns), 30))
+
+        scores = matrix.scores(user_nouns, boosted=matrix.mask(boosted), boost=1.5)
+        result = matrix.top_n(scores, matrix.mask(relevant) & (scores >= 0.2), 6)
+
+        assert result == reference_top_n(
+            museum_nouns, user_nouns, relevant, boosted, 1.5, 0.2, 6
+        )
+
+
+def test_inverted_index_matches_noun_matrix():
+    rng = random.Random(7)
+    vocabulary = [f"noun{i}" for i in range(60)]
+    museum_nouns = {
+        f"Museum {i}": [rng.choice(vocabulary) for _ in range(rng.randint(0, 15))]
+        for i in range(300)
+    }
+    matrix = NounMatrix(museum_nouns)
+    index = InvertedNounIndex(museum_nouns)
+
+    for _ in range(200):
+        user_nouns = [rng.choice(vocabulary + ["unknown"]) for _ in range(rng.randint(0, 40))]
+        relevant = matrix.mask(rng.sample(list(museum_nouns), 250))
+        boosted = matrix.mask(rng.sample(list(museum_nouns), 40))
+        boost = rng.choice([1.0, 1.5])
+        threshold = rng.choice([0, 0.01, 0.2, 0.5])
+        n = rng.randint(1, 8)
+
+        scores = matrix.scores(user_nouns, boosted=boosted, boost=boost)
+        expected = matrix.top_n(scores, relevant & (scores >= threshold), n)
+
+        assert index.top_matches(user_nouns, relevant, n, threshold, boosted, boost) == expected
+
+        # Also through the posting lists when the user shares nouns with most museums
+        index.MAX_POSTING_SHARE = 1.0
+        assert index.top_matches(user_nouns, relevant, n, threshold, boosted, boost) == expected
+        index.MAX_POSTING_SHARE = InvertedNounIndex.MAX_POSTING_SHARE
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from cache import RecommendationCache
+from data import get_context
+from recommenders import RecSystem
+from serving import RecommendationService
+
+
+class SlowRecSystem(RecSystem):
+    # Counts the computations and makes the hidden gems wait until they are released
+    def __init__(self):
+        super().__init__()
+        self.contexts = 0
+        self.release = threading.Event()
+
+    def build_context(self, user):
+        self.contexts += 1
+        return super().build_context(user)
+
+    def hidden_gems(self, user, context=None):
+        self.release.wait(5)
+        return super().hidden_gems(user, context)
+
+
+def test_service_coalesces_and_returns_partial_sections():
+    rs = SlowRecSystem()
+    cache = RecommendationCache()
+    service = RecommendationService(rs, cache, max_workers=4, deadline=0.2)
+    key = str(get_context().user_store.member_ids[0])
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(service.recommend(key)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # One computation for all requests, without the hidden gems after the deadline
+    assert rs.contexts == 1
+    assert service.stats()["coalesced"] == 3
+    assert all(not complete and recs.hidden_gems == [] for _, recs, complete in results)
+
+    rs.release.set()
+    for _ in range(50):
+        if cache.get(key) is not None:
+            break
+        time.sleep(0.01)
+    usr, recs, complete = service.recommend(key)
+    assert complete
+    assert recs == rs.recommend_all(usr)
+    assert rs.contexts == 2
+
+
+class CountingRecSystem(RecSystem):
+    # Counts the computations of the local spots
+    def __init__(self):
+        super().__init__()
+        self.local_spot_calls = 0
+
+    def local_spots(self, user, context=None):
+        self.local_spot_calls += 1
+        return super().local_spots(user, context)
+
+
+def test_service_computes_local_spots_once():
+    rs = CountingRecSystem()
+    service = RecommendationService(rs, RecommendationCache(), max_workers=4, deadline=0)
+    for key in map(str, get_context().user_store.member_ids[:5]):
+        rs.local_spot_calls = 0
+        usr, recs, complete = service.recommend(key)
+        assert complete and rs.local_spot_calls == 1
+        assert recs == rs.recommend_all(usr)
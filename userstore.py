@@ -0,0 +1,158 @@
+"""
+Members and their visits, indexed by PersonID.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+ARRAYS = [
+    "member_ids",
+    "residences",
+    "ages",
+    "person_ids",
+    "visit_offsets",
+    "visit_museums",
+    "museum_names",
+    "visit_dates",
+]
+
+
+class UserStore:
+    """
+    The visits are sorted by PersonID and kept in contiguous arrays with an offset index, so
+    the visits of a member are the slice between two offsets and loading a user does not scan
+    the tables. All data is kept in NumPy arrays, which can be memory-mapped from a snapshot.
+    """
+
+    def __init__(self, arrays: dict):
+        # Sorted PersonIDs of the members, with their residence and age
+        self.member_ids = arrays["member_ids"]
+        self.residences = arrays["residences"]
+        self.ages = arrays["ages"]
+
+        # Sorted PersonIDs of the members with visits. The visits of person_ids[i] are the
+        # rows visit_offsets[i]:visit_offsets[i + 1] of the visit arrays.
+        self.person_ids = arrays["person_ids"]
+        self.visit_offsets = arrays["visit_offsets"]
+        self.visit_museums = arrays["visit_museums"]  # index into museum_names
+        self.museum_names = arrays["museum_names"]
+        self.visit_dates = arrays["visit_dates"]
+
+        # Visits added while running (see add_visits): PersonID -> {museum name: timestamp}.
+        # Only visits newer than the ones in the arrays are kept here, so it holds at most
+        # one timestamp per member and museum ingested since the arrays were built. Once the
+        # deltas are appended to visits.csv, a reload builds them into the arrays and the
+        # overlay of the new store drops them.
+        self.overlay = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_tables(cls, members_df, visits_df) -> "UserStore":
+        members = members_df.drop_duplicates(subset=["PersonID"]).sort_values(
+            by="PersonID"
+        )
+        visits = visits_df.dropna(subset=["MuseumNaam"])
+        visits = visits.sort_values(by="PersonID", kind="stable")
+        visit_persons = visits["PersonID"].to_numpy()
+        person_ids = np.unique(visit_persons)
+        visit_museums, museum_names = pd.factorize(visits["MuseumNaam"])
+
+        return cls(
+            {
+                "member_ids": members["PersonID"].to_numpy(),
+                "residences": members["Woonplaats"].to_numpy(),
+                "ages": members["Leeftijd"].to_numpy(),
+                "person_ids": person_ids,
+                "visit_offsets": np.r_[
+                    np.searchsorted(visit_persons, person_ids), len(visit_persons)
+                ],
+                "visit_museums": visit_museums.astype(np.int32),
+                "museum_names": np.asarray(museum_names, dtype=object),
+                "visit_dates": pd.to_datetime(
+                    visits["BezoekDatum"], format="%Y%m%d"
+                ).to_numpy(),
+            }
+        )
+
+    def save(self, directory: str):
+        # Strings are stored with a fixed width, so that every array can be memory-mapped
+        for name in ARRAYS:
+            array = getattr(self, name)
+            if array.dtype == object:
+                array = array.astype(str)
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "UserStore":
+        mmap_mode = "r" if mmap else None
+        return cls(
+            {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                for name in ARRAYS
+            }
+        )
+
+    def _find(self, ids: np.ndarray, person_id: str) -> int:
+        # Position of person_id in the sorted ids, or -1 if it is not there
+        position = np.searchsorted(ids, person_id)
+        if position < len(ids) and ids[position] == person_id:
+            return int(position)
+        return -1
+
+    def member(self, person_id: str) -> tuple:
+        # Returns the (residence, age) of a member
+        position = self._find(self.member_ids, person_id)
+        if position < 0:
+            raise KeyError(person_id)
+        return self.residences[position], self.ages[position]
+
+    def visits(self, person_id: str) -> list[tuple]:
+        # Returns the (museum name, timestamp) of every museum visited by a member
+        position = self._find(self.person_ids, person_id)
+        if position < 0:
+            visits = []
+        else:
+            start, end = self.visit_offsets[position], self.visit_offsets[position + 1]
+            visits = list(
+                zip(
+                    self.museum_names[self.visit_museums[start:end]],
+                    pd.DatetimeIndex(self.visit_dates[start:end]),
+                )
+            )
+
+        added = self.overlay.get(person_id)
+        if added:
+            # Like drop_duplicates, only the most recent visit to a museum is kept
+            visits = list({**dict(visits), **added}.items())
+        return visits
+
+    def add_visits(self, visits: list[tuple]) -> set:
+        """
+        Add new visits without rebuilding the arrays.
+
+        Parameters:
+        visits (list): (PersonID, museum name, timestamp) tuples.
+
+        Returns:
+        set: The PersonIDs whose visits changed.
+        """
+        by_person = {}
+        for person_id, museum_name, timestamp in visits:
+            by_person.setdefault(person_id, []).append((museum_name, timestamp))
+
+        changed = set()
+        with self._lock:
+            for person_id, new_visits in by_person.items():
+                latest = dict(self.visits(person_id))
+                added = dict(self.overlay.get(person_id, {}))
+                for museum_name, timestamp in new_visits:
+                    if museum_name not in latest or timestamp > latest[museum_name]:
+                        latest[museum_name] = added[museum_name] = timestamp
+                        changed.add(person_id)
+                # Replaced instead of updated, so readers never see a half-updated member
+                if added:
+                    self.overlay[person_id] = added
+        return changed